@@ -0,0 +1,65 @@
+""" Recall and latency of the IVF database against brute-force MemoryDB search.
+
+Usage: python -m benchmarks.ann_recall [--size 200000] [--queries 1000]
+"""
+import argparse
+import time
+import numpy as np
+import db
+
+
+def synthetic_embeddings(size, dim=128, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(size, dim)).astype(np.float32)
+    # dlib embeddings lie close to the unit sphere.
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def fill(storage, embeddings):
+    start = time.perf_counter()
+    for face_id, embedding in enumerate(embeddings):
+        storage.add(str(face_id), embedding)
+    return time.perf_counter() - start
+
+
+def timed_search(storage, queries, k):
+    start = time.perf_counter()
+    face_ids = [storage.find_k_closest_by_dlib_embedding(query, k)[0] for query in queries]
+    return face_ids, (time.perf_counter() - start) / len(queries)
+
+
+def recall(found, expected):
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+
+def main(args):
+    embeddings = synthetic_embeddings(args.size)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(args.size, args.queries)]
+    queries = queries + rng.normal(scale=args.noise, size=queries.shape).astype(np.float32)
+
+    exact = db.initialize('memory')
+    fill(exact, embeddings)
+    expected, exact_latency = timed_search(exact, queries, args.k)
+    print(f"brute force: {exact_latency * 1e3:.3f} ms/query")
+
+    for n_probe in args.n_probe:
+        index = db.initialize('ivf', {'n_lists': args.n_lists, 'n_probe': n_probe,
+                                      'min_train_size': args.size})
+        fill_time = fill(index, embeddings)
+        found, latency = timed_search(index, queries, args.k)
+        print(f"ivf n_lists={args.n_lists} n_probe={n_probe}: "
+              f"recall@{args.k}={recall(found, expected):.3f} "
+              f"{latency * 1e3:.3f} ms/query "
+              f"speedup={exact_latency / latency:.1f}x build={fill_time:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.05)
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--n-lists', type=int, default=512)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    main(parser.parse_args())
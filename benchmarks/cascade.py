@@ -0,0 +1,87 @@
+""" Accuracy and latency of cascade recognition prefilters against the exact full scan.
+
+Every identity gets a unit embedding and a smooth gray face image; queries are
+noisy copies of both. Reports top-1 accuracy, agreement with the exact scan and
+latency per query for every prefilter and shortlist size.
+
+Usage: python -m benchmarks.cascade [--size 10000] [--shortlists 8 32 128]
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+import db
+import utils
+from face import recognizers
+from .ann_recall import synthetic_embeddings
+
+
+def synthetic_faces(size, shape=(60, 60), seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(size):
+        noise = rng.integers(0, 256, (shape[0] // 6, shape[1] // 6), dtype=np.uint8)
+        yield cv2.resize(noise, shape[::-1], interpolation=cv2.INTER_CUBIC)
+
+
+def timed(recognizer, storage, queries):
+    start = time.perf_counter()
+    face_ids = [recognizer(face_image, storage, embedding)[1] for embedding, face_image in queries]
+    return face_ids, (time.perf_counter() - start) / len(queries)
+
+
+def main(args):
+    rng = np.random.default_rng(1)
+    embeddings = synthetic_embeddings(args.size)
+    faces = list(synthetic_faces(args.size))
+    truth = rng.choice(args.size, args.queries)
+    # Recognizers take BGR crops like the ones the processor cuts from frames.
+    queries = [(embeddings[i] + rng.normal(scale=args.noise, size=embeddings.shape[1]),
+                cv2.cvtColor(np.clip(faces[i] + rng.normal(scale=args.image_noise, size=faces[i].shape),
+                                     0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR))
+               for i in truth]
+    truth = [str(i) for i in truth]
+
+    memory = db.initialize('memory')
+    for face_id, (embedding, face_image) in enumerate(zip(embeddings, faces)):
+        memory.add(str(face_id), (embedding, utils.svd(face_image, args.rank)) if args.svd else embedding)
+    storages = {'memory': memory}
+    if args.ivf:
+        storages['ivf'] = db.initialize('ivf', {'n_lists': args.n_lists, 'n_probe': args.n_probe,
+                                                'min_train_size': args.size})
+        for face_id, embedding in enumerate(embeddings):
+            storages['ivf'].add(str(face_id), embedding)
+
+    exact, exact_latency = timed(recognizers.DLibRecognizer(None), memory, queries)
+    print(f"{'recognizer':<34} {'accuracy':>8} {'agree':>6} {'ms':>8}")
+    print(f"{'dlib full scan':<34} {np.mean(np.array(exact) == truth):>8.3f} {1:>6.3f} {exact_latency * 1e3:>8.3f}")
+    if args.svd:
+        svd_only, svd_latency = timed(recognizers.DlibSVDRecognizer(None), memory, queries)
+        print(f"{'dlib_svd single candidate':<34} {np.mean(np.array(svd_only) == truth):>8.3f}"
+              f" {np.mean(np.array(svd_only) == exact):>6.3f} {svd_latency * 1e3:>8.3f}")
+
+    stages = ([('svd', 'memory')] if args.svd else []) + [('pca', 'memory')] + \
+        ([('index', 'ivf')] if args.ivf else [])
+    for prefilter, storage in stages:
+        for shortlist in args.shortlists:
+            recognizer = recognizers.CascadeRecognizer(None, prefilter, shortlist, pca_dim=args.pca_dim)
+            recognizer(queries[0][1], storages[storage], queries[0][0])  # fit the PCA outside timing
+            found, latency = timed(recognizer, storages[storage], queries)
+            name = f"cascade {prefilter}/{storage} shortlist={shortlist}"
+            print(f"{name:<34} {np.mean(np.array(found) == truth):>8.3f}"
+                  f" {np.mean(np.array(found) == exact):>6.3f} {latency * 1e3:>8.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.1)
+    parser.add_argument('--image-noise', type=float, default=20.)
+    parser.add_argument('--rank', type=int, default=16)
+    parser.add_argument('--pca-dim', type=int, default=32)
+    parser.add_argument('--shortlists', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--no-svd', dest='svd', action='store_false', help="skip SVD, it needs ~8 KB per face")
+    parser.add_argument('--ivf', action='store_true', help="also shortlist with the ivf database")
+    parser.add_argument('--n-lists', type=int, default=128)
+    parser.add_argument('--n-probe', type=int, default=8)
+    main(parser.parse_args())
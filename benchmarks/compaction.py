@@ -0,0 +1,63 @@
+""" Gallery size, search latency and merge quality of duplicate-identity compaction.
+
+Every person is enrolled several times with noisy copies of their embedding,
+as when a track misses the threshold and becomes a new id. Reports how many
+ids are left, how many groups wrongly merged two people, and the search
+latency before and after compaction.
+
+Usage: python -m benchmarks.compaction [--persons 20000] [--copies 3] [--thresholds 0.3 0.4 0.5]
+"""
+import argparse
+import collections
+import time
+import numpy as np
+import db
+from .ann_recall import synthetic_embeddings, timed_search
+
+
+def gallery(persons, embeddings, copies, noise, rng):
+    storage = db.initialize('memory')
+    owners = {}
+    for person in range(persons):
+        for _ in range(rng.integers(1, 2 * copies)):
+            face_id = storage.generate_face_id()
+            storage.add(face_id, embeddings[person] + rng.normal(scale=noise, size=embeddings.shape[1]))
+            owners[face_id] = person
+    return storage, owners
+
+
+def main(args):
+    rng = np.random.default_rng(1)
+    # Person embeddings about 1.4 apart, as unit vectors in high dimension.
+    embeddings = synthetic_embeddings(args.persons)
+    queries = embeddings[rng.choice(args.persons, args.queries)]
+
+    for threshold in args.thresholds:
+        storage, owners = gallery(args.persons, embeddings, args.copies, args.noise, np.random.default_rng(2))
+        size = len(storage)
+        _, before = timed_search(storage, queries, 1)
+        start = time.perf_counter()
+        mapping = db.compaction.compact(storage, threshold, args.merge)
+        elapsed = time.perf_counter() - start
+        _, after = timed_search(storage, queries, 1)
+
+        members = collections.defaultdict(set)
+        for face_id in storage.get_face_ids():
+            members[face_id].add(owners[face_id])
+        for removed, kept in mapping.items():
+            members[kept].add(owners[removed])
+        impure = sum(len(people) > 1 for people in members.values())
+        print(f"threshold={threshold}: {size} -> {len(storage)} ids for {args.persons} persons, "
+              f"{impure} mixed, compaction {elapsed:.1f}s, "
+              f"search {before * 1e3:.3f} -> {after * 1e3:.3f} ms/query")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--persons', type=int, default=20000)
+    parser.add_argument('--copies', type=int, default=3, help="mean enrollments per person")
+    parser.add_argument('--noise', type=float, default=0.02, help="per-dimension std of enrollment noise")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--merge', default='centroid', choices=db.compaction.MERGES)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.3, 0.4, 0.5])
+    main(parser.parse_args())
@@ -0,0 +1,58 @@
+""" Recall, latency and memory of the compressed database against brute-force MemoryDB search.
+
+The compressed database keeps only its codes in RAM, the float32 embeddings
+used for re-ranking stay on disk. It trades speed for that memory: scanning
+the codes and re-ranking from disk is slower per query than brute force over
+float32 embeddings in RAM, e.g. about 1.1 against 0.3 ms at 5k faces.
+
+Usage: python -m benchmarks.compressed [--size 100000] [--quantizers pq sq8] [--reranks 0 32 128]
+"""
+import argparse
+import tempfile
+import numpy as np
+import db
+from .ann_recall import synthetic_embeddings, fill, timed_search, recall
+
+
+def main(args):
+    embeddings = synthetic_embeddings(args.size)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(args.size, args.queries)]
+    queries = queries + rng.normal(scale=args.noise, size=queries.shape).astype(np.float32)
+
+    exact = db.initialize('memory')
+    fill(exact, embeddings)
+    expected, exact_latency = timed_search(exact, queries, args.k)
+    print(f"brute force: {exact_latency * 1e3:.3f} ms/query, {embeddings.shape[1] * 4} B/identity")
+
+    with tempfile.TemporaryDirectory() as root:
+        for quantizer in args.quantizers:
+            path = f"{root}/{quantizer}"
+            storage = db.initialize('compressed', {'path': path, 'quantizer': quantizer, 'm': args.m,
+                                                   'min_train_size': min(args.size, 65536),
+                                                   'sync_every': args.size})
+            fill_time = fill(storage, embeddings)
+            code_size = storage.code_size
+            storage.close()
+            for rerank in args.reranks:
+                # The trained database reopened with each re-rank depth, rerank=0 ranks by the codes alone.
+                storage = db.initialize('compressed', {'path': path, 'quantizer': quantizer, 'm': args.m,
+                                                       'rerank': rerank, 'read_only': True})
+                found, latency = timed_search(storage, queries, args.k)
+                print(f"{quantizer} m={args.m if quantizer == 'pq' else code_size} rerank={rerank}: "
+                      f"recall@{args.k}={recall(found, expected):.3f} "
+                      f"{latency * 1e3:.3f} ms/query ({latency / exact_latency:.1f}x brute force) "
+                      f"{code_size} B/identity ({embeddings.shape[1] * 4 / code_size:.0f}x smaller) "
+                      f"build={fill_time:.1f}s")
+                storage.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.05)
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--m', type=int, default=16, help="pq sub-vectors, i.e. bytes per code")
+    parser.add_argument('--quantizers', nargs='+', default=['pq', 'sq8'])
+    parser.add_argument('--reranks', type=int, nargs='+', default=[0, 32, 128])
+    main(parser.parse_args())
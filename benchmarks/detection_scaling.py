@@ -0,0 +1,52 @@
+""" Throughput of tiled ParallelDetector against the plain detector as workers grow.
+
+Usage: python -m benchmarks.detection_scaling [--image frame.jpg] [--workers 1 2 4 8]
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+import face
+
+
+def fps(detector, frame, repeats):
+    detector(frame)  # warm up workers and shared memory
+    start = time.perf_counter()
+    for _ in range(repeats):
+        boxes = detector(frame)
+    return repeats / (time.perf_counter() - start), len(boxes)
+
+
+def main(args):
+    if args.image:
+        frame = cv2.resize(cv2.imread(args.image), tuple(args.resolution))
+    else:
+        frame = np.random.default_rng(0).integers(
+            0, 256, (args.resolution[1], args.resolution[0], 3), dtype=np.uint8)
+    detector_config = {'name': args.detector, 'params': {}}
+
+    serial = face.detectors.get(**detector_config)
+    base_fps, n_boxes = fps(serial, frame, args.repeats)
+    print(f"{serial}: {base_fps:.2f} fps, {n_boxes} boxes")
+
+    for workers in args.workers:
+        detector = face.detectors.get('parallel_detector', {
+            'detector': detector_config, 'workers': workers,
+            'tile_size': args.tile_size, 'overlap': args.overlap})
+        try:
+            det_fps, n_boxes = fps(detector, frame, args.repeats)
+        finally:
+            detector.close()
+        print(f"{detector}: {det_fps:.2f} fps ({det_fps / base_fps:.2f}x), {n_boxes} boxes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--resolution', type=int, nargs=2, default=[3840, 2160])
+    parser.add_argument('--detector', default='cascade_detector')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--tile-size', type=int, nargs=2, default=[960, 960])
+    parser.add_argument('--overlap', type=int, default=128)
+    parser.add_argument('--repeats', type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,66 @@
+""" Recognition accuracy and search latency of MemoryDB as the number of exemplars per face grows.
+
+Every person looks different in each of a few poses, sightings lie anywhere
+between the first pose and another one. A person is enrolled from the first
+pose, then the embeddings of a stream of sightings are added as
+exemplars whenever they are recognized, as the processor does. Queries come
+from any pose and count as recognized when the closest face is the right
+person and closer than the threshold.
+
+Usage: python -m benchmarks.exemplars [--persons 10000] [--exemplars 1 2 4 8]
+"""
+import argparse
+import time
+import numpy as np
+import db
+from .ann_recall import synthetic_embeddings
+
+
+def sightings(persons, poses, spread, noise, size, rng):
+    """ `size` (person, embedding) pairs, each of a random person turning from the first to a random pose. """
+    people = rng.integers(0, len(persons), size)
+    turn = rng.random((size, 1))
+    pose = (1 - turn) * poses[people, 0] + turn * poses[people, rng.integers(1, poses.shape[1], size)]
+    embeddings = persons[people] + pose * spread
+    embeddings += rng.normal(scale=noise, size=embeddings.shape)
+    return people, embeddings.astype(np.float32)
+
+
+def main(args):
+    rng = np.random.default_rng(1)
+    persons = synthetic_embeddings(args.persons)
+    poses = synthetic_embeddings(args.persons * args.poses, seed=2).reshape(args.persons, args.poses, -1)
+    updates = sightings(persons, poses, args.spread, args.noise, args.updates, rng)
+    truth, queries = sightings(persons, poses, args.spread, args.noise, args.queries, rng)
+
+    for exemplars in args.exemplars:
+        storage = db.initialize('memory', {'exemplars': exemplars})
+        for person in range(args.persons):
+            storage.add(str(person), persons[person] + poses[person, 0] * args.spread)
+        added = 0
+        for person, embedding in zip(*updates):
+            face_ids, dists = storage.find_k_closest_by_dlib_embedding(embedding)
+            if dists[0] < args.threshold:
+                storage.add_exemplar(face_ids[0], embedding)
+                added += 1
+
+        start = time.perf_counter()
+        face_ids, dists = storage.find_k_closest_by_dlib_embeddings(queries)
+        latency = (time.perf_counter() - start) / len(queries)
+        recognized = np.array([ids[0] for ids in face_ids]) == truth.astype(str)
+        recognized &= dists[:, 0] < args.threshold
+        print(f"exemplars={exemplars}: accuracy={recognized.mean():.3f} "
+              f"{latency * 1e3:.3f} ms/query ({added} sightings added)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--persons', type=int, default=10000)
+    parser.add_argument('--poses', type=int, default=4)
+    parser.add_argument('--spread', type=float, default=0.6, help="distance of a pose from the person")
+    parser.add_argument('--noise', type=float, default=0.02, help="per-dimension std of every sighting")
+    parser.add_argument('--updates', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--exemplars', type=int, nargs='+', default=[1, 2, 4, 8])
+    main(parser.parse_args())
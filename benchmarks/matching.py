@@ -0,0 +1,66 @@
+""" Micro-benchmarks of box matching: scalar loops against the face.matching kernels.
+
+Usage: python -m benchmarks.matching [--sizes 10 100 1000]
+"""
+import argparse
+import time
+import numpy as np
+import utils
+from face import matching
+
+
+def random_boxes(n, rng, frame=(1920, 1080)):
+    wh = rng.integers(40, 160, (n, 2))
+    xy = rng.integers(0, np.array(frame) - 160, (n, 2))
+    return [tuple(box) for box in np.hstack([xy, wh]).tolist()]
+
+
+def jitter(boxes, rng, scale=8):
+    return [tuple(v + int(d) for v, d in zip(box, rng.integers(-scale, scale, 4)))
+            for box in boxes]
+
+
+def timeit(fun, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fun()
+    return (time.perf_counter() - start) / repeats * 1e3
+
+
+def scalar_iou_matrix(boxes_a, boxes_b):
+    return [[utils.bb_intersection_over_union(a, b) for b in boxes_b] for a in boxes_a]
+
+
+def scalar_greedy_match(tracks, detections):
+    detections = list(detections)
+    for box in tracks:
+        matched_ok, box_id = utils.match_box(box, detections)
+        if matched_ok:
+            del detections[box_id]
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} {'kernel':<24} {'ms':>10}")
+    for n in args.sizes:
+        tracks = random_boxes(n, rng)
+        detections = jitter(tracks, rng)
+        repeats = max(1, args.budget // n)
+        slow_repeats = max(1, repeats // 10)
+        results = [
+            ('iou scalar loops', timeit(lambda: scalar_iou_matrix(tracks, detections), slow_repeats)),
+            ('iou_matrix', timeit(lambda: matching.iou_matrix(tracks, detections), repeats)),
+            ('match_box greedy loop', timeit(lambda: scalar_greedy_match(tracks, detections), slow_repeats)),
+            ('match greedy', timeit(lambda: matching.match(tracks, detections, method='greedy'), repeats)),
+            ('match hungarian', timeit(lambda: matching.match(tracks, detections), slow_repeats)),
+            ('nms', timeit(lambda: matching.nms(tracks + detections, 0.2), repeats)),
+        ]
+        for name, ms in results:
+            print(f"{n:>6} {name:<24} {ms:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--budget', type=int, default=1000, help="repeats x boxes per kernel")
+    main(parser.parse_args())
@@ -0,0 +1,280 @@
+""" End-to-end throughput and tracking stability of the processing pipeline, headless.
+
+Every detector/tracker/recognizer combination runs in its own process over a
+recorded frame set or a synthetic video and reports fps, per-stage latency,
+peak RSS and ID switches. Results are written as JSON; pass a previous file as
+`--baseline` to print the change against it. `face_recognizer` is the fake
+recognizer, it runs with `fake_encoder` and needs no dlib model files. The
+`ground_truth` detector returns the boxes of the synthetic video.
+
+Usage: python -m benchmarks.pipeline [--frames "frames/%08d.jpg" | --synthetic 300]
+           [--detectors cascade_detector] [--trackers kalman_tracker mil_tracker]
+           [--recognizers face_recognizer dlib_recognizer] [--output results.json]
+"""
+import argparse
+import copy
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import yaml
+import db
+import face
+import pipeline
+import utils
+
+GROUND_TRUTH = 'ground_truth'
+ENCODERS = {
+    'face_recognizer': 'fake_encoder',
+    'dlib_recognizer': 'dlib_encoder',
+    'dlib_svd_recognizer': 'dlib_svd_encoder',
+    'cascade_recognizer': 'dlib_encoder',
+}
+
+
+class SyntheticVideo:
+    """ Textured patches moving over a smooth noise background, with their boxes as ground truth. """
+
+    def __init__(self, n_frames, resolution=(1280, 720), n_faces=4, face_size=(60, 140), seed=0):
+        rng = np.random.default_rng(seed)
+        self.width, self.height = resolution
+        self._n_frames = n_frames
+        self._frame = 0
+        noise = rng.integers(0, 256, (self.height // 16, self.width // 16, 3), dtype=np.uint8)
+        self._background = cv2.resize(noise, resolution, interpolation=cv2.INTER_CUBIC)
+        sizes = rng.integers(*face_size, n_faces)
+        self._textures = [cv2.GaussianBlur(rng.integers(0, 256, (size, size, 3), dtype=np.uint8), (5, 5), 0)
+                          for size in sizes]
+        self._positions = rng.uniform(0, 1, (n_faces, 2)) * ([self.width, self.height] - sizes[:, None])
+        self._velocities = rng.uniform(-4, 4, (n_faces, 2))
+        self.boxes = []
+
+    def read(self):
+        if self._frame >= self._n_frames:
+            return False, None
+        self._frame += 1
+        image = self._background.copy()
+        self.boxes = []
+        for face_id, (texture, position, velocity) in enumerate(
+                zip(self._textures, self._positions, self._velocities)):
+            size = len(texture)
+            limit = np.array([self.width, self.height]) - size
+            position += velocity
+            bounce = (position < 0) | (position > limit)
+            velocity[bounce] *= -1
+            np.clip(position, 0, limit, out=position)
+            x, y = position.astype(int)
+            image[y:y + size, x:x + size] = texture
+            self.boxes.append((face_id, (x, y, size, size)))
+        return True, image
+
+    def release(self):
+        pass
+
+
+class GroundTruthDetector(face.detectors.AbstractDetector):
+
+    def __init__(self, video):
+        self._video = video
+
+    def __call__(self, frame):
+        scale = frame.shape[1] / self._video.width
+        return [tuple(int(v * scale) for v in box) for _, box in self._video.boxes]
+
+    def __repr__(self):
+        return "<GroundTruthDetector()>"
+
+
+def combination_config(config, detector, tracker, recognizer):
+    config = copy.deepcopy(config)
+    config['database'] = {'kind': 'memory'}
+    config['metrics'] = {'enabled': True, 'sample_rate': 1., 'window': 1 << 20}
+
+    def params(section, name):
+        return config[section]['params'] if config[section]['name'] == name else {}
+
+    if detector == GROUND_TRUTH:
+        # Ground truth boxes are given in frame coordinates, not in tracker ROIs.
+        config.setdefault('detection_scheduler', {})['roi_only'] = False
+    else:
+        config['face_detector'] = {'name': detector, 'params': params('face_detector', detector)}
+    config['face_tracker'] = {'name': tracker, 'params': params('face_tracker', tracker)}
+    encoder = ENCODERS[recognizer]
+    config['face_encoder'] = {'name': encoder, 'params': params('face_encoder', encoder)}
+    config['face_recognizer'] = {'name': recognizer, 'params': params('face_recognizer', recognizer)}
+    if recognizer not in face.progressive.RECOGNIZERS:
+        config.pop('progressive_recognition', None)
+    if encoder == 'fake_encoder':
+        # The quality scorer may not need model files.
+        if 'face_selection' in config:
+            config['face_selection'].get('params', {}).pop('path_to_landmark_model', None)
+    return config
+
+
+def id_switches(history, ground_truth=None, min_iou=0.5):
+    """ Times a face kept its box but changed its resolved id.
+
+    With ground truth, the resolved id matched to every true face is followed
+    over the whole run. Without it, resolved faces are matched to the resolved
+    faces of the previous frame by IoU.
+    """
+    switches = 0
+    last = {}
+    previous = []
+    for i, faces in enumerate(history):
+        faces = [(face_id, box) for face_id, box in faces if not utils.is_tmp_id(face_id)]
+        reference = previous if ground_truth is None else ground_truth[i]
+        pairs = face.matching.match([box for _, box in reference], [box for _, box in faces], min_iou)
+        for ref, j in pairs:
+            if ground_truth is None:
+                prior = reference[ref][0]
+            else:
+                prior = last.get(reference[ref][0])
+                last[reference[ref][0]] = faces[j][0]
+            if prior is not None and prior != faces[j][0]:
+                switches += 1
+        previous = faces
+    return switches
+
+
+def measure(config, source, max_frames, detector, trace_malloc=False):
+    video = SyntheticVideo(**source['synthetic']) if 'synthetic' in source else None
+    storage = db.initialize(**config['database'])
+    processor = pipeline.processor.Processor(config, storage)
+    if detector == GROUND_TRUTH:
+        if video is None:
+            raise ValueError("The ground_truth detector needs a synthetic video.")
+        processor._face_detector = GroundTruthDetector(video)
+
+    stream = pipeline.stream.Stream(source.get('frames'), config['face_buffer_size'],
+                                    face_buffer_params=config.get('face_buffer'), capturer=video,
+                                    reid_params=config.get('reid_cache'))
+    history, ground_truth = [], []
+    elapsed = allocated = 0.
+    if trace_malloc:
+        tracemalloc.start()
+    try:
+        while len(history) < max_frames:
+            read_ok, image = stream.read()
+            if not read_ok:
+                break
+            if trace_malloc:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            processor.process(stream, image)
+            elapsed += time.perf_counter() - start
+            if trace_malloc:
+                allocated += tracemalloc.get_traced_memory()[1] - base
+            history.append(list(stream.faces))
+            if video is not None:
+                ground_truth.append(list(video.boxes))
+        snapshot = processor.metrics.snapshot()
+    finally:
+        stream.release()
+        processor.close()
+
+    resolved = {face_id for faces in history for face_id, _ in faces if not utils.is_tmp_id(face_id)}
+    return dict(
+        status='ok',
+        frames=len(history),
+        fps=len(history) / elapsed if elapsed else 0.,
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        # Memory allocated on top of what was alive before a frame, at its peak.
+        frame_alloc_kb=allocated / max(len(history), 1) / 1024 if trace_malloc else None,
+        id_switches=id_switches(history, ground_truth or None),
+        identities=len(resolved),
+        faces=sum(len(faces) for faces in history),
+        counters=snapshot['counters'],
+        stages_ms={name: {key: value * 1e3 if key != 'count' else value for key, value in timing.items()}
+                   for name, timing in snapshot['timings'].items()},
+    )
+
+
+def run_combination(config, source, max_frames, trace_malloc, detector, tracker, recognizer):
+    combination = {'detector': detector, 'tracker': tracker, 'recognizer': recognizer}
+    try:
+        config = combination_config(config, detector, tracker, recognizer)
+        return dict(combination, **measure(config, source, max_frames, detector, trace_malloc))
+    except Exception as e:
+        return dict(combination, status='error', error=f"{type(e).__name__}: {e}")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = {(r['detector'], r['tracker'], r['recognizer']): r
+                    for r in json.load(file)['results'] if r['status'] == 'ok'}
+    for result in results:
+        before = baseline.get((result['detector'], result['tracker'], result['recognizer']))
+        if before is None or result['status'] != 'ok':
+            continue
+        print(f"{result['detector']}/{result['tracker']}/{result['recognizer']}:"
+              f" fps {(result['fps'] / before['fps'] - 1) * 100:+.1f}%,"
+              f" id switches {result['id_switches'] - before['id_switches']:+d},"
+              f" peak rss {result['peak_rss_mb'] - before['peak_rss_mb']:+.1f} MB")
+
+
+def main(args):
+    with open(args.config) as file:
+        config = yaml.safe_load(file)
+    if args.synthetic:
+        source = {'synthetic': {'n_frames': args.synthetic, 'resolution': tuple(args.resolution),
+                                'n_faces': args.faces, 'seed': args.seed}}
+    else:
+        source = {'frames': args.frames or pipeline.stream.get_sources(config)[0]}
+    detectors = args.detectors or [GROUND_TRUTH if args.synthetic else config['face_detector']['name']]
+    max_frames = args.max_frames or args.synthetic or float('inf')
+
+    # A fresh process per combination keeps peak RSS and warm caches apart.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    print(f"{'detector':<18} {'tracker':<16} {'recognizer':<20} {'fps':>8} {'rss MB':>8} {'switches':>8}")
+    for combination in itertools.product(detectors, args.trackers, args.recognizers):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_combination, config, source, max_frames, args.trace_malloc, *combination).result()
+        results.append(result)
+        if result['status'] == 'ok':
+            print(f"{result['detector']:<18} {result['tracker']:<16} {result['recognizer']:<20}"
+                  f" {result['fps']:>8.1f} {result['peak_rss_mb']:>8.1f} {result['id_switches']:>8}")
+        else:
+            print(f"{combination[0]:<18} {combination[1]:<16} {combination[2]:<20} {result['error']}")
+
+    meta = {
+        'time': time.time(),
+        'source': source,
+        'max_frames': None if max_frames == float('inf') else max_frames,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'cpus': multiprocessing.cpu_count(),
+    }
+    with open(args.output, 'w') as file:
+        json.dump({'meta': meta, 'results': results}, file, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--frames', default=None, help="frame pattern or video, defaults to the config source")
+    parser.add_argument('--synthetic', type=int, default=0, help="number of synthetic frames instead of --frames")
+    parser.add_argument('--resolution', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--faces', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-frames', type=int, default=0)
+    parser.add_argument('--detectors', nargs='+', default=None)
+    parser.add_argument('--trackers', nargs='+', default=['kalman_tracker', 'mil_tracker', 'kcf_tracker'])
+    parser.add_argument('--recognizers', nargs='+', default=['face_recognizer', 'dlib_recognizer'])
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--trace-malloc', action='store_true',
+                        help="report per-frame allocations, slows every frame down")
+    main(parser.parse_args())
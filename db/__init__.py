@@ -1,8 +1,19 @@
 from .memory import MemoryDB
+from .ivf import IVFDB
+from .disk import DiskDB
+from .compressed import CompressedDB
+from .enrollment import EnrollmentQueue
+from . import compaction
 
 
 def initialize(kind, params=None):
     if kind == 'memory':
-        return MemoryDB()
+        return MemoryDB(**(params or {}))
+    elif kind == 'ivf':
+        return IVFDB(**(params or {}))
+    elif kind == 'disk':
+        return DiskDB(**(params or {}))
+    elif kind == 'compressed':
+        return CompressedDB(**(params or {}))
     else:
         raise ValueError(f"Database of kind '{kind}' is not found.")
@@ -0,0 +1,89 @@
+import numpy as np
+from . import search
+
+MERGES = ('centroid', 'keep')
+# Rows and columns of the distance tiles of `duplicate_groups`, bounds their memory to block x block.
+_BLOCK = 1024
+
+
+def _find(parents, i):
+    root = i
+    while parents[root] != root:
+        root = parents[root]
+    while parents[i] != root:
+        parents[i], i = root, parents[i]
+    return root
+
+
+def duplicate_groups(embeddings, threshold=0.4, block=_BLOCK):
+    """ Row indices of every group of two or more embeddings chained by distances under `threshold`.
+
+    Pairwise distances are computed a `block` x `block` tile at a time over the
+    upper triangle, and the close pairs of each tile are joined with union-find.
+    Chaining means two rows of a group may be further apart than `threshold`.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    sq_norms = search.squared_norms(embeddings)
+    parents = np.arange(len(embeddings))
+    for start in range(0, len(embeddings), block):
+        end = min(start + block, len(embeddings))
+        for col_start in range(start, len(embeddings), block):
+            col_end = min(col_start + block, len(embeddings))
+            dists = search.distances(embeddings[start:end], embeddings[col_start:col_end],
+                                     sq_norms[col_start:col_end])
+            rows, cols = np.nonzero(dists < threshold)
+            rows, cols = rows + start, cols + col_start
+            # Upper triangle only: each pair once and never a row with itself.
+            later = cols > rows
+            for i, j in zip(rows[later], cols[later]):
+                root_i, root_j = _find(parents, i), _find(parents, j)
+                if root_i != root_j:
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([_find(parents, i) for i in range(len(embeddings))], dtype=np.intp)
+    order = np.argsort(roots, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(roots[order])) + 1)
+    return [group for group in groups if len(group) > 1]
+
+
+def _id_order(face_id):
+    return (0, int(face_id), '') if face_id.isdigit() else (1, 0, face_id)
+
+
+def compact(storage, threshold=0.4, merge='centroid', block=_BLOCK):
+    """ Merge faces of `storage` whose dlib embeddings are duplicates, see `duplicate_groups`.
+
+    Every group keeps its oldest face id. With `merge='centroid'` that face gets
+    the mean embedding of the group, or takes the exemplars of the others when
+    the storage keeps several per face. With 'keep' it keeps its own embedding.
+    The other faces of the group are removed. Returns `{removed_face_id:
+    kept_face_id}` so references held elsewhere can be remapped.
+
+    Memory databases shrink in place. Disk databases tombstone the removed rows
+    and are then vacuumed, so their files and scans shrink too.
+    """
+    if merge not in MERGES:
+        raise ValueError(f"Merge '{merge}' is not supported. Use one of {MERGES}.")
+    face_ids = storage.get_face_ids()
+    if len(face_ids) < 2:
+        return {}
+    embeddings = storage.get_dlib_embeddings(face_ids)
+
+    mapping = {}
+    for group in duplicate_groups(embeddings, threshold, block):
+        group = sorted(group, key=lambda row: _id_order(face_ids[row]))
+        kept = face_ids[group[0]]
+        if merge == 'centroid' and storage.exemplars > 1:
+            for row in group[1:]:
+                for exemplar in storage.get_exemplars(face_ids[row]):
+                    storage.add_exemplar(kept, exemplar)
+        elif merge == 'centroid':
+            centroid = embeddings[group].mean(axis=0)
+            face = storage.get_face(kept)
+            # SVD factors of the kept face stay with it.
+            storage.add(kept, (centroid, face[1]) if isinstance(face, tuple) else centroid)
+        for row in group[1:]:
+            storage.remove(face_ids[row])
+            mapping[face_ids[row]] = kept
+    if mapping and storage.persistent:
+        storage.vacuum()
+    return mapping
@@ -0,0 +1,220 @@
+import os
+import glob
+import numpy as np
+from . import quantization, search
+from .disk import DiskDB
+
+# Rows coded per step when (re)training, bounds the float32 rows read at once.
+_TRAIN_BLOCK = 65536
+
+
+class CompressedDB(DiskDB):
+    """ Disk database searched through compact codes instead of full embeddings.
+
+    Every row also gets a `pq` code (`m` bytes) or an `sq8` code (one byte per
+    dimension) in a memory-mapped codes file. A query scores all codes with
+    asymmetric distance lookup tables, then re-ranks its `rerank` best rows by
+    exact distance on the float32 embeddings, which are only read for them.
+    The quantizer is trained on up to `max_train_size` stored embeddings once
+    `min_train_size` faces were added, search is exact before that.
+    """
+
+    def __init__(self, path='storage', dim=128, id_size=32, capacity=1024, sync_every=32,
+                 read_only=False, quantizer='pq', m=16, rerank=32, min_train_size=4096,
+                 max_train_size=65536, kmeans_iters=10, seed=0):
+        self._quantizer_path = os.path.join(path, 'quantizer.npz')
+        self._quantizer_kind = quantizer
+        self._quantizer_params = {'m': m, 'kmeans_iters': kmeans_iters, 'seed': seed} \
+            if quantizer == 'pq' else None
+        quantization.get(quantizer, dim, self._quantizer_params)  # fail early on bad settings
+        self._rerank = rerank
+        self._min_train_size = max(min_train_size, 256)
+        self._max_train_size = max_train_size
+        self._seed = seed
+        self._quantizer = None
+        self._generation = 0
+        self._codes = None
+        self._live_cache = None
+        self._load_quantizer(path, read_only)
+        super().__init__(path, dim, id_size, capacity, sync_every, read_only)
+
+    def _codes_path(self, generation=None, data_generation=None):
+        """ Codes of quantizer `generation` for the rows of data file `data_generation`. """
+        generation = self._generation if generation is None else generation
+        data_generation = self._data_generation if data_generation is None else data_generation
+        name = f'codes-{generation}.u8' if data_generation == 0 else f'codes-{generation}-{data_generation}.u8'
+        return os.path.join(self._path, name)
+
+    def _load_quantizer(self, path, read_only):
+        self._path = path
+        if os.path.exists(self._quantizer_path):
+            with np.load(self._quantizer_path) as state:
+                self._generation = int(state['generation'])
+                self._quantizer = quantization.from_state(state)
+
+    def _remove_stale_files(self):
+        super()._remove_stale_files()
+        # Codes of a training or a vacuum that crashed before or after its commit.
+        for codes_path in glob.glob(os.path.join(self._path, 'codes-*.u8')):
+            if self._quantizer is None or codes_path != self._codes_path():
+                os.remove(codes_path)
+
+    def _map(self):
+        super()._map()
+        if self._quantizer is not None:
+            self._map_codes()
+
+    def _map_codes(self):
+        self._codes = self._open_codes(self._quantizer)
+
+    def _open_codes(self, quantizer):
+        code_size = quantizer.code_size
+        codes_path = self._codes_path()
+        if not self._read_only and os.path.getsize(codes_path) < len(self._embeddings) * code_size:
+            os.truncate(codes_path, len(self._embeddings) * code_size)
+        capacity = os.path.getsize(codes_path) // code_size
+        return np.memmap(codes_path, np.uint8, 'r' if self._read_only else 'r+', shape=(capacity, code_size))
+
+    def _grow(self):
+        # The old codes stay mapped for searches still holding them, `_map` replaces them.
+        if self._codes is not None:
+            self._codes.flush()
+        super()._grow()
+
+    @property
+    def is_trained(self):
+        return self._quantizer is not None
+
+    @property
+    def code_size(self):
+        """ Bytes per face kept in RAM, None until trained. """
+        return None if self._quantizer is None else self._quantizer.code_size
+
+    def train(self):
+        """ Fit a new quantizer on the stored embeddings and code every row with it. """
+        self._check_writable()
+        rows = np.flatnonzero(self._live_mask())
+        if len(rows) > self._max_train_size:
+            rows = np.sort(np.random.default_rng(self._seed).choice(rows, self._max_train_size, replace=False))
+        quantizer = quantization.get(self._quantizer_kind, self._dim, self._quantizer_params)
+        quantizer.fit(self._embeddings[rows])
+
+        generation = self._generation + 1
+        codes = np.memmap(self._codes_path(generation), np.uint8, 'w+',
+                          shape=(len(self._embeddings), quantizer.code_size))
+        for start in range(0, self._size, _TRAIN_BLOCK):
+            end = min(start + _TRAIN_BLOCK, self._size)
+            codes[start:end] = quantizer.encode(self._embeddings[start:end])
+        codes.flush()
+        del codes
+
+        # Replacing the quantizer file commits the new codes, the old ones are dropped after.
+        tmp_path = self._quantizer_path + '.tmp'
+        with open(tmp_path, 'wb') as state_file:
+            np.savez(state_file, generation=generation, **quantizer.state())
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(tmp_path, self._quantizer_path)
+        old_codes_path = self._codes_path() if self._quantizer is not None else None
+        self._generation = generation
+        # Codes before quantizer: searches read the quantizer first, and an untrained one ignores the codes.
+        self._codes = self._open_codes(quantizer)
+        self._quantizer = quantizer
+        if old_codes_path is not None:
+            os.remove(old_codes_path)
+
+    def _write_generation(self, rows, generation, capacity):
+        super()._write_generation(rows, generation, capacity)
+        if self._quantizer is not None:
+            codes = np.memmap(self._codes_path(data_generation=generation), np.uint8, 'w+',
+                              shape=(capacity, self._quantizer.code_size))
+            codes[:len(rows)] = self._codes[rows]
+            codes.flush()
+
+    def _remove_generation(self, generation):
+        super()._remove_generation(generation)
+        if self._quantizer is not None:
+            os.remove(self._codes_path(data_generation=generation))
+
+    def _build_rows(self):
+        rows = super()._build_rows()
+        # The mask cached while building the rows misses the superseded rows found.
+        self._live_cache = None
+        return rows
+
+    def _live_mask(self, size=None):
+        size = self._size if size is None else size
+        cache = self._live_cache
+        if cache is None or cache[0] != size:
+            cache = self._live_cache = size, super()._live_mask(size)
+        return cache[1]
+
+    def _write(self, row, encoded_face_id, face_embedding):
+        super()._write(row, encoded_face_id, face_embedding)
+        if self._quantizer is not None:
+            self._codes[row] = self._quantizer.encode(face_embedding)[0]
+        self._live_cache = None
+
+    def add(self, face_id, face_embedding):
+        super().add(face_id, face_embedding)
+        if self._quantizer is None and self._size >= self._min_train_size:
+            self.train()
+
+    def remove(self, face_id):
+        super().remove(face_id)
+        self._live_cache = None
+
+    def sync(self):
+        # Codes must be durable before the rows they belong to get committed.
+        if self._codes is not None and not self._read_only:
+            self._codes.flush()
+        super().sync()
+        self._live_cache = None
+
+    def refresh(self):
+        if os.path.exists(self._quantizer_path):
+            with np.load(self._quantizer_path) as state:
+                if int(state['generation']) != self._generation:
+                    self._generation = int(state['generation'])
+                    self._quantizer = quantization.from_state(state)
+                    self._codes = None
+        super().refresh()
+        if self._quantizer is not None and (self._codes is None or len(self._codes) < self._size):
+            self._map_codes()
+        self._live_cache = None
+
+    def close(self):
+        super().close()
+        self._codes = None
+
+    def find_k_closest_by_dlib_embeddings(self, face_embeddings, k=1, metric='euclidean'):
+        # Quantizer before codes and size, see `train` and `DiskDB.add`.
+        quantizer = self._quantizer
+        if quantizer is None or metric != 'euclidean':
+            return super().find_k_closest_by_dlib_embeddings(face_embeddings, k, metric)
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+
+        size = self._size
+        live = self._live_mask(size)
+        n_live = int(live.sum())
+        queries = search.as_queries(face_embeddings)
+        approx = quantizer.distances(queries, self._codes[:size])
+        approx[:, ~live] = np.inf
+        shortlists, _ = search.top_k(approx, min(max(self._rerank, k), n_live))
+
+        k = min(k, n_live)
+        out_face_ids = []
+        out_dists = np.empty((len(queries), k), dtype=np.float32)
+        for i, rows in enumerate(shortlists):
+            # Sorted rows read the embeddings file front to back.
+            rows = np.sort(rows)
+            dists = search.distances(queries[i:i + 1], self._embeddings[rows], self._records['sq_norm'][rows])
+            idx, dists = search.top_k(dists, k)
+            out_face_ids.append([face_id.decode() for face_id in self._records['face_id'][rows[idx[0]]]])
+            out_dists[i] = dists[0]
+        return out_face_ids, out_dists
+
+    def __repr__(self):
+        return f"<CompressedDB(path='{self._path}', size={self._size}, quantizer={self._quantizer}," \
+               f" rerank={self._rerank})>"
@@ -0,0 +1,342 @@
+import glob
+import os
+import struct
+import threading
+import numpy as np
+import utils
+from . import search
+
+_MAGIC = b'SPYEYEDB'
+# magic, embedding dim, max face id bytes, committed record count, data file generation,
+# largest numeric face id of the rows dropped by `vacuum`
+_HEADER = struct.Struct('<8sIIQQQ')
+_COUNT_OFFSET = 16
+_HEADER_SIZE = 64
+# Rows copied per step by `vacuum`, bounds the rows read at once.
+_VACUUM_BLOCK = 65536
+
+
+class DiskDB:
+    """ Append-only embedding store kept in memory-mapped files.
+
+    `embeddings.f32` holds raw float32 rows and `index.bin` holds a small header
+    followed by one fixed-size (face_id, sq_norm, deleted) record per row. Only
+    rows below the committed count in the header are trusted, so a crash can at
+    most lose the appends made since the last `sync`. Opening maps both files
+    without reading them, and read-only stores can be shared between processes.
+    One thread may `add` and `sync` while others search.
+
+    Removed and re-added faces leave dead rows behind until `vacuum` rewrites
+    the live ones into `embeddings-<generation>.f32`, named by the header.
+    """
+
+    persistent = True
+    exemplars = 1
+
+    def __init__(self, path='storage', dim=128, id_size=32, capacity=1024,
+                 sync_every=32, read_only=False):
+        self._path = path
+        self._data_path = self._data_file(0)
+        self._index_path = os.path.join(path, 'index.bin')
+        self._sync_every = sync_every
+        self._read_only = read_only
+
+        if not os.path.exists(self._index_path):
+            if read_only:
+                raise FileNotFoundError(f"Database '{path}' does not exist.")
+            self._create(dim, id_size, capacity)
+
+        self._index_fd = os.open(self._index_path, os.O_RDONLY if read_only else os.O_RDWR)
+        magic, self._dim, id_size, self._size, self._data_generation, self._vacuumed_face_id = \
+            _HEADER.unpack(os.pread(self._index_fd, _HEADER.size, 0))
+        if magic != _MAGIC:
+            raise ValueError(f"'{self._index_path}' is not a face database index.")
+        self._data_path = self._data_file(self._data_generation)
+        self._record = np.dtype([('face_id', f'S{id_size}'), ('sq_norm', '<f4'), ('deleted', 'u1')])
+
+        self._pending = 0
+        self._superseded = []
+        self._rows_cache = None
+        # Rebuilt after a vacuum by a searching or a writing thread, whichever comes first.
+        self._rows_lock = threading.Lock()
+        self._last_face_id = None
+        self._map()
+        if self._size > len(self._embeddings):
+            raise ValueError(f"Database '{path}' is truncated.")
+        # Searches mask superseded rows without looking at `_rows`, so they are found at once.
+        self._build_rows()
+        if not read_only:
+            self._remove_stale_files()
+
+    def _data_file(self, generation):
+        name = 'embeddings.f32' if generation == 0 else f'embeddings-{generation}.f32'
+        return os.path.join(self._path, name)
+
+    def _remove_stale_files(self):
+        # Left over from a vacuum that crashed before or after its commit.
+        for data_path in glob.glob(os.path.join(self._path, 'embeddings*.f32')):
+            if data_path != self._data_path:
+                os.remove(data_path)
+
+    def _create(self, dim, id_size, capacity):
+        os.makedirs(self._path, exist_ok=True)
+        with open(self._data_path, 'wb') as data_file:
+            data_file.truncate(capacity * dim * 4)
+        # The index is written last: its presence means the store is complete.
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(_HEADER.pack(_MAGIC, dim, id_size, 0, 0, 0).ljust(_HEADER_SIZE, b'\0'))
+            index_file.truncate(_HEADER_SIZE + capacity * (id_size + 5))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(tmp_path, self._index_path)
+
+    def _map(self):
+        capacity = os.path.getsize(self._data_path) // (4 * self._dim)
+        mode = 'r' if self._read_only else 'r+'
+        self._embeddings = np.memmap(self._data_path, np.float32, mode,
+                                     shape=(capacity, self._dim))
+        self._records = np.memmap(self._index_path, self._record, mode,
+                                  offset=_HEADER_SIZE, shape=(capacity,))
+
+    def _grow(self):
+        self._embeddings.flush()
+        self._records.flush()
+        capacity = 2 * len(self._embeddings)
+        # The old maps stay valid for searches still holding them.
+        os.truncate(self._data_path, capacity * self._dim * 4)
+        os.truncate(self._index_path, _HEADER_SIZE + capacity * self._record.itemsize)
+        self._map()
+
+    def _check_writable(self):
+        if self._read_only:
+            raise ValueError(f"Database '{self._path}' is opened read-only.")
+
+    @property
+    def _rows(self):
+        with self._rows_lock:
+            return self._rows_cache if self._rows_cache is not None else self._build_rows()
+
+    def _build_rows(self):
+        rows, superseded = {}, []
+        face_ids = self._records['face_id']
+        for row in np.flatnonzero(self._live_mask()):
+            face_id = face_ids[row].decode()
+            if face_id in rows:
+                # Committed but not tombstoned yet by the writer, or left over from
+                # a crash in between. Read-only handles only mask it.
+                superseded.append(rows[face_id])
+            rows[face_id] = row
+        self._superseded.extend(superseded)
+        self._rows_cache = rows
+        return rows
+
+    def _live_mask(self, size=None):
+        # Superseded rows are read before the tombstones `sync` turns them into.
+        superseded = self._superseded
+        size = self._size if size is None else size
+        live = self._records['deleted'][:size] == 0
+        live[[row for row in superseded if row < size]] = False
+        return live
+
+    def sync(self):
+        """ Make all appends durable, then commit them by bumping the header count. """
+        if self._read_only:
+            return
+        self._embeddings.flush()
+        self._records.flush()
+        os.pwrite(self._index_fd, struct.pack('<Q', self._size), _COUNT_OFFSET)
+        os.fsync(self._index_fd)
+        if self._superseded:
+            self._records['deleted'][self._superseded] = 1
+            self._records.flush()
+            self._superseded = []
+        self._pending = 0
+
+    def vacuum(self):
+        """ Rewrite the live rows into new files, so removed and re-added faces stop
+        costing space and search time.
+
+        The new files are written first, then an index naming them replaces the
+        old one, so a crash leaves one of the two stores whole. Not safe while
+        other threads search, read-only handles in other processes switch on `refresh`.
+        """
+        self._check_writable()
+        self.sync()
+        last_face_id = int(self.generate_face_id()) - 1
+        rows = np.flatnonzero(self._live_mask())
+        generation = self._data_generation + 1
+        capacity = max(len(rows), 64)
+        self._write_generation(rows, generation, capacity)
+
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'wb') as index_file:
+            header = _HEADER.pack(_MAGIC, self._dim, self._record['face_id'].itemsize, len(rows),
+                                  generation, last_face_id)
+            index_file.write(header.ljust(_HEADER_SIZE, b'\0'))
+            index_file.truncate(_HEADER_SIZE + capacity * self._record.itemsize)
+        records = np.memmap(tmp_path, self._record, 'r+', offset=_HEADER_SIZE, shape=(capacity,))
+        for start in range(0, len(rows), _VACUUM_BLOCK):
+            block = rows[start:start + _VACUUM_BLOCK]
+            records[start:start + len(block)] = self._records[block]
+        records.flush()
+        del records
+        tmp_fd = os.open(tmp_path, os.O_RDWR)
+        os.fsync(tmp_fd)
+        os.close(tmp_fd)
+        os.replace(tmp_path, self._index_path)
+
+        old_generation = self._data_generation
+        os.close(self._index_fd)
+        self._index_fd = os.open(self._index_path, os.O_RDWR)
+        self._data_generation, self._data_path = generation, self._data_file(generation)
+        self._size, self._vacuumed_face_id = len(rows), last_face_id
+        self._superseded, self._rows_cache, self._pending = [], None, 0
+        self._map()
+        self._remove_generation(old_generation)
+
+    def _write_generation(self, rows, generation, capacity):
+        """ Durably write the files of data generation `generation` holding `rows`. """
+        embeddings = np.memmap(self._data_file(generation), np.float32, 'w+', shape=(capacity, self._dim))
+        for start in range(0, len(rows), _VACUUM_BLOCK):
+            block = rows[start:start + _VACUUM_BLOCK]
+            embeddings[start:start + len(block)] = self._embeddings[block]
+        embeddings.flush()
+
+    def _remove_generation(self, generation):
+        os.remove(self._data_file(generation))
+
+    def refresh(self):
+        """ Pick up rows committed, or a vacuum done, by a writer in another process. """
+        vacuumed = os.stat(self._index_path).st_ino != os.fstat(self._index_fd).st_ino
+        if vacuumed:
+            os.close(self._index_fd)
+            self._index_fd = os.open(self._index_path, os.O_RDONLY if self._read_only else os.O_RDWR)
+            *_, self._data_generation, self._vacuumed_face_id = \
+                _HEADER.unpack(os.pread(self._index_fd, _HEADER.size, 0))
+            self._data_path = self._data_file(self._data_generation)
+            self._superseded = []
+        self._size, = struct.unpack('<Q', os.pread(self._index_fd, 8, _COUNT_OFFSET))
+        if vacuumed or self._size > len(self._embeddings):
+            self._map()
+        with self._rows_lock:
+            self._build_rows()
+        self._last_face_id = None
+
+    def close(self):
+        self.sync()
+        del self._embeddings, self._records
+        os.close(self._index_fd)
+
+    def _write(self, row, encoded_face_id, face_embedding):
+        embedding = self._embeddings[row] = face_embedding
+        self._records[row] = (encoded_face_id, embedding @ embedding, 0)
+
+    def add(self, face_id, face_embedding):
+        self._check_writable()
+        encoded_face_id = face_id.encode()
+        if len(encoded_face_id) > self._record['face_id'].itemsize:
+            raise ValueError(f"Face id '{face_id}' is too long for this database.")
+
+        rows = self._rows
+        if face_id in rows:
+            # The old row is tombstoned only once the new one is committed.
+            self._superseded.append(rows[face_id])
+        if self._size == len(self._embeddings):
+            self._grow()
+        row = self._size
+        self._write(row, encoded_face_id, utils.dlib_embedding(face_embedding))
+        self._size += 1
+        rows[face_id] = row
+        if face_id.isdigit() and self._last_face_id is not None:
+            self._last_face_id = max(self._last_face_id, int(face_id))
+
+        self._pending += 1
+        if self._pending >= self._sync_every:
+            self.sync()
+
+    def remove(self, face_id):
+        self._check_writable()
+        row = self._rows.pop(face_id)
+        self._records['deleted'][row] = 1
+        self._pending += 1
+
+    def get_face(self, face_id):
+        return np.array(self._embeddings[self._rows[face_id]])
+
+    def get_dlib_embeddings(self, face_ids):
+        """ Dlib embeddings of `face_ids` stacked into a matrix. """
+        rows = [self._rows[face_id] for face_id in face_ids]
+        return np.array(self._embeddings[rows], dtype=np.float64)
+
+    def get_dlib_distances(self, face_embedding, face_ids):
+        """ Euclidean distances of a dlib embedding to `face_ids`. """
+        return np.linalg.norm(self.get_dlib_embeddings(face_ids) - np.asarray(face_embedding), axis=1)
+
+    def get_face_ids(self):
+        return list(self._rows.keys())
+
+    def is_empty(self):
+        return not self._live_mask().any()
+
+    def __contains__(self, face_id):
+        return face_id in self._rows
+
+    def __len__(self):
+        return int(self._live_mask().sum())
+
+    def find_k_closest_by_dlib_embeddings(self, face_embeddings, k=1, metric='euclidean'):
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+
+        # Read once, rows appended meanwhile by a writer thread are left out.
+        size = self._size
+        live = self._live_mask(size)
+        dists = search.distances(search.as_queries(face_embeddings),
+                                 self._embeddings[:size],
+                                 self._records['sq_norm'][:size], metric)
+        dists[:, ~live] = np.inf
+        rows, dists = search.top_k(dists, min(k, int(live.sum())))
+        face_ids = self._records['face_id'][rows]
+        return [[face_id.decode() for face_id in ids] for ids in face_ids], dists
+
+    def find_k_closest_by_dlib_embedding(self, face_embedding, k=1, metric='euclidean'):
+        face_ids, dists = self.find_k_closest_by_dlib_embeddings([face_embedding], k, metric)
+        return face_ids[0], dists[0]
+
+    def find_closest_by_dlib_embedding(self, face_embedding, dist_fun=utils.euc_dist):
+        if dist_fun is utils.euc_dist:
+            face_ids, dists = self.find_k_closest_by_dlib_embedding(face_embedding)
+            return face_ids[0], float(dists[0])
+
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+        min_dist = float('inf')
+        min_dist_face_id = -1
+        for face_id, row in self._rows.items():
+            dist = dist_fun(face_embedding, self._embeddings[row])
+            if dist < min_dist:
+                min_dist = dist
+                min_dist_face_id = face_id
+        return min_dist_face_id, min_dist
+
+    def find_closest_by_svd_embedding(self, face_image):
+        raise ValueError("SVD embeddings are not stored by the disk database.")
+
+    def find_k_closest_by_svd_embedding(self, face_image, k=1):
+        raise ValueError("SVD embeddings are not stored by the disk database.")
+
+    def find_k_closest_by_pca_embedding(self, face_embedding, k=1, dim=32):
+        raise ValueError("The disk database keeps no PCA index, use the 'index' prefilter.")
+
+    def generate_face_id(self):
+        if self._last_face_id is None:
+            # Deleted and vacuumed rows count too, so ids are never reused.
+            face_ids = (face_id.decode() for face_id in self._records['face_id'][:self._size])
+            self._last_face_id = max(
+                (int(face_id) for face_id in face_ids if face_id.isdigit()), default=0)
+            self._last_face_id = max(self._last_face_id, self._vacuumed_face_id)
+        return str(self._last_face_id + 1)
+
+    def __repr__(self):
+        return f"<DiskDB(path='{self._path}', size={self._size}, read_only={self._read_only})>"
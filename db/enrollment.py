@@ -0,0 +1,283 @@
+import threading
+import numpy as np
+import utils
+from .memory import MemoryDB
+
+
+class EnrollmentQueue:
+    """ Write-behind front of a face database: enrolled faces are searchable at once, stored later.
+
+    `add` only puts the face into an in-memory pending index, searched together
+    with the storage, and returns. A worker thread writes pending faces to the
+    storage in batches of up to `max_batch`, syncing persistent storages once
+    per batch. With `max_pending` faces not yet written, `add` blocks until the
+    worker catches up. `close` writes everything still pending.
+
+    Searches never wait for the worker's writes: they only hold the lock of
+    the pending index, the worker writes under a lock of its own, and a face
+    leaves the pending index once it is synced. Only `remove`, `add_exemplar`
+    and PCA searches, which change the storage, wait for a batch in progress.
+    """
+
+    def __init__(self, storage, max_pending=256, max_batch=32):
+        self.storage = storage
+        self._max_pending = max_pending
+        self._max_batch = max_batch
+        # Guards the pending index and queue. Searches of the storage hold it too,
+        # but its writes only hold `_write_lock`, see `DiskDB` and `MemoryDB.add`.
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()
+        self._index = None
+        self._queue = []
+        # Enrollment number of every pending face, a face re-enrolled while written stays pending.
+        self._versions = {}
+        self._enrolled = 0
+        self._last_face_id = None
+        self._error = None
+        self._closed = False
+        self.batches = 0
+        self.written = 0
+        # Started last, the worker uses every attribute above.
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def persistent(self):
+        return self.storage.persistent
+
+    @property
+    def exemplars(self):
+        return self.storage.exemplars
+
+    @property
+    def pending(self):
+        """ Faces enrolled but not written to the storage yet. """
+        with self._lock:
+            return 0 if self._index is None else len(self._index)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError("Enrollment worker failed.") from self._error
+
+    def add(self, face_id, face_embedding):
+        with self._cond:
+            self._check_error()
+            if self._closed:
+                raise RuntimeError("Enrollment queue is closed.")
+            self._cond.wait_for(lambda: self.pending < self._max_pending or self._error is not None)
+            self._check_error()
+            if self._index is None:
+                self._index = MemoryDB(dim=len(utils.dlib_embedding(face_embedding)))
+            self._index.add(face_id, face_embedding)
+            self._enrolled += 1
+            self._versions[face_id] = self._enrolled
+            self._queue.append(face_id)
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._closed)
+            batch = self._queue[:self._max_batch]
+            del self._queue[:self._max_batch]
+            return batch
+
+    def _take(self, batch):
+        """ Faces of `batch` still pending with their embedding and enrollment number. """
+        with self._lock:
+            return [(face_id, self._index.get_face(face_id), self._versions[face_id])
+                    for face_id in batch if face_id in self._index]
+
+    def _release(self, faces):
+        """ Drop written faces from the pending index, unless enrolled again meanwhile. """
+        with self._cond:
+            for face_id, _, version in faces:
+                if self._versions.get(face_id) == version:
+                    del self._versions[face_id]
+                    self._index.remove(face_id)
+            self.batches += 1
+            self.written += len(faces)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                # Removed or written by an earlier batch of a re-enrolled face are skipped.
+                faces = self._take(batch)
+                with self._write_lock:
+                    for face_id, face_embedding, _ in faces:
+                        self.storage.add(face_id, face_embedding)
+                    if self.storage.persistent:
+                        self.storage.sync()
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            self._release(faces)
+
+    def flush(self):
+        """ Wait until every face enrolled so far is written to the storage. """
+        with self._cond:
+            self._cond.wait_for(lambda: self.pending == 0 or self._error is not None)
+            self._check_error()
+
+    def close(self):
+        """ Write whatever is still pending and stop the worker, the storage stays open. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._check_error()
+
+    def add_exemplar(self, face_id, face_embedding):
+        """ Add an exemplar of a stored face, pending faces keep their enrollment embedding. """
+        if self.storage.exemplars == 1:
+            return
+        with self._write_lock, self._lock:
+            if face_id in self.storage:
+                self.storage.add_exemplar(face_id, face_embedding)
+
+    def remove(self, face_id):
+        with self._write_lock, self._lock:
+            if self._index is not None and face_id in self._index:
+                self._index.remove(face_id)
+                del self._versions[face_id]
+            if face_id in self.storage:
+                self.storage.remove(face_id)
+
+    def _sources(self):
+        return [source for source in (self.storage, self._index) if source is not None and not source.is_empty()]
+
+    def get_face(self, face_id):
+        with self._lock:
+            if self._index is not None and face_id in self._index:
+                return self._index.get_face(face_id)
+            return self.storage.get_face(face_id)
+
+    def get_dlib_embeddings(self, face_ids):
+        with self._lock:
+            return np.array([utils.dlib_embedding(self.get_face(face_id)) for face_id in face_ids],
+                            dtype=np.float64)
+
+    def get_dlib_distances(self, face_embedding, face_ids):
+        with self._lock:
+            dists = np.empty(len(face_ids))
+            for i, face_id in enumerate(face_ids):
+                source = self._index if self._index is not None and face_id in self._index else self.storage
+                dists[i] = source.get_dlib_distances(face_embedding, [face_id])[0]
+            return dists
+
+    def get_face_ids(self):
+        with self._lock:
+            face_ids = self.storage.get_face_ids()
+            if self._index is not None:
+                face_ids += [face_id for face_id in self._index.get_face_ids() if face_id not in self.storage]
+            return face_ids
+
+    def is_empty(self):
+        with self._lock:
+            return not self._sources()
+
+    def __contains__(self, face_id):
+        with self._lock:
+            return face_id in self.storage or (self._index is not None and face_id in self._index)
+
+    def __len__(self):
+        with self._lock:
+            if self._index is None:
+                return len(self.storage)
+            return len(self.storage) + sum(face_id not in self.storage for face_id in self._index.get_face_ids())
+
+    def find_k_closest_by_dlib_embeddings(self, face_embeddings, k=1, metric='euclidean'):
+        with self._lock:
+            sources = self._sources()
+            if not sources:
+                raise ValueError("Search is impossible. Storage is empty.")
+            results = [source.find_k_closest_by_dlib_embeddings(face_embeddings, k, metric)
+                       for source in sources]
+        if len(results) == 1:
+            return results[0]
+        merged = [_merge([(ids[i], dists[i]) for ids, dists in results], k) for i in range(len(results[0][0]))]
+        n = min(len(ids) for ids, _ in merged)
+        return [ids[:n] for ids, _ in merged], np.stack([dists[:n] for _, dists in merged])
+
+    def find_k_closest_by_dlib_embedding(self, face_embedding, k=1, metric='euclidean'):
+        face_ids, dists = self.find_k_closest_by_dlib_embeddings([face_embedding], k, metric)
+        return face_ids[0], dists[0]
+
+    def find_closest_by_dlib_embedding(self, face_embedding, dist_fun=utils.euc_dist):
+        if dist_fun is utils.euc_dist:
+            face_ids, dists = self.find_k_closest_by_dlib_embedding(face_embedding)
+            return face_ids[0], float(dists[0])
+        with self._lock:
+            sources = self._sources()
+            if not sources:
+                raise ValueError("Search is impossible. Storage is empty.")
+            return min((source.find_closest_by_dlib_embedding(face_embedding, dist_fun) for source in sources),
+                       key=lambda found: found[1])
+
+    def find_k_closest_by_svd_embedding(self, face_image, k=1):
+        with self._lock:
+            sources = self._sources()
+            if not sources:
+                raise ValueError("Search is impossible. Storage is empty.")
+            # Pending faces without SVD factors can not be found by them.
+            results = [source.find_k_closest_by_svd_embedding(face_image, k) for source in sources
+                       if source is not self._index or self._index._svd_u is not None]
+        if not results:
+            raise ValueError("Search is impossible. No SVD embeddings are stored.")
+        return _merge(results, k)
+
+    def find_closest_by_svd_embedding(self, face_image):
+        face_ids, _ = self.find_k_closest_by_svd_embedding(face_image)
+        return face_ids[0], utils.dlib_embedding(self.get_face(face_ids[0]))
+
+    def find_k_closest_by_pca_embedding(self, face_embedding, k=1, dim=32):
+        """ The storage's PCA shortlist followed by the `k` closest pending faces.
+
+        Too few faces are pending for a PCA of their own, they are shortlisted by
+        exact distance instead, so the two lists are not merged by distance.
+        """
+        # Fitting the PCA changes the storage.
+        with self._write_lock, self._lock:
+            face_ids, dists = [], []
+            if not self.storage.is_empty():
+                face_ids, dists = self.storage.find_k_closest_by_pca_embedding(face_embedding, k, dim)
+                face_ids, dists = list(face_ids), [dists]
+            if self._index is not None and not self._index.is_empty():
+                pending_ids, pending_dists = self._index.find_k_closest_by_dlib_embedding(face_embedding, k)
+                face_ids, dists = face_ids + list(pending_ids), dists + [pending_dists]
+            if not face_ids:
+                raise ValueError("Search is impossible. Storage is empty.")
+            return face_ids, np.concatenate(dists)
+
+    def generate_face_id(self):
+        with self._lock:
+            # Pending faces are not in the storage yet, so its next id may be taken.
+            face_id = int(self.storage.generate_face_id())
+            if self._last_face_id is not None:
+                face_id = max(face_id, self._last_face_id + 1)
+            self._last_face_id = face_id
+            return str(face_id)
+
+    def __repr__(self):
+        return f"<EnrollmentQueue(storage={self.storage}, pending={self.pending}," \
+               f" max_pending={self._max_pending}, max_batch={self._max_batch})>"
+
+
+def _merge(results, k):
+    """ `k` closest of several (face_ids, dists) results of one query, each id once. """
+    face_ids = [face_id for ids, _ in results for face_id in ids]
+    dists = np.concatenate([dists for _, dists in results])
+    out_ids, out_dists = [], []
+    for i in np.argsort(dists, kind='stable'):
+        if face_ids[i] not in out_ids:
+            out_ids.append(face_ids[i])
+            out_dists.append(dists[i])
+            if len(out_ids) == k:
+                break
+    return out_ids, np.array(out_dists, dtype=dists.dtype)
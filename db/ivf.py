@@ -0,0 +1,135 @@
+import numpy as np
+from . import search
+from .memory import MemoryDB
+
+
+def kmeans(data, n_clusters, n_iters=10, seed=0):
+    """ Plain Lloyd's k-means, returns (n_clusters, dim) float32 centroids. """
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    sq_norms = search.squared_norms(data)
+    for _ in range(n_iters):
+        labels = np.argmin(search.distances(
+            centroids, data, sq_norms), axis=0)
+        counts = np.bincount(labels, minlength=n_clusters)
+        order = np.argsort(labels, kind='stable')
+        starts = np.searchsorted(labels[order], np.arange(n_clusters))
+        empty = counts == 0
+        sums = np.add.reduceat(data[order], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed empty clusters with random points instead of leaving them dead.
+        centroids[empty] = data[rng.choice(len(data), empty.sum())]
+    return centroids
+
+
+class IVFDB(MemoryDB):
+    """ Inverted file index over dlib embeddings with k-means coarse quantization.
+
+    Below `min_train_size` entries search is exact. Once trained, a query only
+    scans the `n_probe` lists whose centroids are closest to it. The quantizer is
+    retrained whenever the storage grows by `retrain_growth` since last training.
+    """
+
+    def __init__(self, dim=128, capacity=64, n_lists=256, n_probe=8,
+                 min_train_size=4096, max_train_size=65536, retrain_growth=2.,
+                 kmeans_iters=10, seed=0):
+        super().__init__(dim, capacity)
+        self._n_lists = n_lists
+        self._n_probe = n_probe
+        self._min_train_size = max(min_train_size, n_lists)
+        self._max_train_size = max_train_size
+        self._retrain_growth = retrain_growth
+        self._kmeans_iters = kmeans_iters
+        self._seed = seed
+
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._lists = []
+        self._trained_size = 0
+        self._assignment = np.empty(capacity, dtype=np.int32)
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def _grow(self):
+        super()._grow()
+        assignment = np.empty(len(self._embeddings), dtype=np.int32)
+        assignment[:self._size] = self._assignment[:self._size]
+        self._assignment = assignment
+
+    def _assign(self, embeddings):
+        dists = search.distances(embeddings, self._centroids, self._centroid_sq_norms)
+        return np.argmin(dists, axis=1)
+
+    def train(self):
+        embeddings = self._embeddings[:self._size]
+        rng = np.random.default_rng(self._seed)
+        sample = embeddings
+        if len(sample) > self._max_train_size:
+            sample = embeddings[rng.choice(len(embeddings), self._max_train_size, replace=False)]
+        self._centroids = kmeans(sample, self._n_lists, self._kmeans_iters, self._seed)
+        self._centroid_sq_norms = search.squared_norms(self._centroids)
+
+        labels = self._assign(embeddings)
+        self._assignment[:self._size] = labels
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self._n_lists + 1))
+        self._lists = [order[start:stop].tolist() for start, stop in zip(bounds[:-1], bounds[1:])]
+        self._trained_size = self._size
+
+    def _drop_from_list(self, row):
+        self._lists[self._assignment[row]].remove(row)
+
+    def add(self, face_id, face_embedding):
+        row = self._rows.get(face_id)
+        if self.is_trained and row is not None:
+            self._drop_from_list(row)
+        super().add(face_id, face_embedding)
+
+        if self.is_trained:
+            row = self._rows[face_id]
+            label = self._assign(self._embeddings[row:row + 1])[0]
+            self._assignment[row] = label
+            self._lists[label].append(row)
+            if self._size >= self._retrain_growth * self._trained_size:
+                self.train()
+        elif self._size >= self._min_train_size:
+            self.train()
+
+    def remove(self, face_id):
+        if self.is_trained:
+            row, last = self._rows[face_id], self._size - 1
+            self._drop_from_list(row)
+            if row != last:
+                moved = self._lists[self._assignment[last]]
+                moved[moved.index(last)] = row
+                self._assignment[row] = self._assignment[last]
+        super().remove(face_id)
+
+    def find_k_closest_by_dlib_embeddings(self, face_embeddings, k=1, metric='euclidean'):
+        if not self.is_trained:
+            return super().find_k_closest_by_dlib_embeddings(face_embeddings, k, metric)
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+
+        queries = search.as_queries(face_embeddings)
+        probes = search.top_k(search.distances(
+            queries, self._centroids, self._centroid_sq_norms), self._n_probe)[0]
+
+        out_face_ids = []
+        out_dists = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.fromiter((row for label in lists for row in self._lists[label]),
+                               dtype=np.intp)
+            if not len(rows):
+                rows = np.arange(self._size)
+            dists = search.distances(query[None], self._embeddings[rows],
+                                     self._sq_norms[rows], metric)
+            idx, dists = search.top_k(dists, k)
+            out_face_ids.append(list(self._ids[rows[idx[0]]]))
+            out_dists[i, :dists.shape[1]] = dists[0]
+        return out_face_ids, out_dists
+
+    def __repr__(self):
+        return f"<IVFDB(n_lists={self._n_lists}, n_probe={self._n_probe}, size={self._size})>"
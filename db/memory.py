@@ -1,17 +1,207 @@
 import numpy as np
 import utils
+from . import search
+
+# Stored SVDs projected per block in `find_closest_by_svd_embedding`, bounds temporaries.
+_SVD_BLOCK = 1024
+# The PCA index is refit once the storage grew by this factor since the last fit.
+_PCA_REFIT_GROWTH = 2.
 
 
 class MemoryDB:
+    """ Face embeddings kept in growing float32 arrays, searched by brute force.
+
+    With `exemplars` above 1 every face also keeps up to that many embeddings,
+    fed by `add_exemplar`, in one packed (capacity, exemplars, dim) array. Its
+    main embedding is then their centroid and searches take the distance to
+    its closest exemplar.
+    """
+
+    persistent = False
 
-    def __init__(self):
+    def __init__(self, dim=128, capacity=64, exemplars=1):
         self._storage = {}
+        self._rows = {}
+        self._size = 0
+        self._last_face_id = 0
+        self._embeddings = np.empty((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=object)
+        # Truncated SVD factors of DlibSVDEncoder embeddings, one row per face like
+        # `_embeddings`. `v` holds `vh` transposed. Allocated by the first SVD added.
+        self._has_svd = np.zeros(capacity, dtype=bool)
+        self._svd_u = self._svd_s = self._svd_v = None
+        # Embeddings reduced by PCA for shortlisting, built by the first PCA search.
+        self._pca_mean = self._pca_basis = None
+        self._reduced = self._reduced_sq_norms = None
+        self._pca_size = 0
+        self.exemplars = exemplars
+        self._exemplars = self._exemplar_sq_norms = self._n_exemplars = None
+        if exemplars > 1:
+            self._exemplars = np.zeros((capacity, exemplars, dim), dtype=np.float32)
+            self._exemplar_sq_norms = np.zeros((capacity, exemplars), dtype=np.float32)
+            self._n_exemplars = np.zeros(capacity, dtype=np.int32)
+
+    def __setstate__(self, state):
+        # Pickles of older versions lack the attributes added since, the oldest
+        # only hold the `_storage` dict of face_id -> embedding or (embedding, usv_mats).
+        if '_embeddings' not in state:
+            storage = state['_storage']
+            dim = len(utils.dlib_embedding(next(iter(storage.values())))) if storage else 128
+            MemoryDB.__init__(self, dim=dim, capacity=max(len(storage), 64))
+            for face_id, face_embedding in storage.items():
+                self.add(face_id, face_embedding)
+            return
+        capacity, dim = state['_embeddings'].shape
+        MemoryDB.__init__(self, dim=dim, capacity=capacity, exemplars=state.get('exemplars', 1))
+        self.__dict__.update(state)
+
+    def _resized(self, array, capacity):
+        out = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        out[:self._size] = array[:self._size]
+        return out
+
+    def _grow(self):
+        capacity = 2 * len(self._embeddings)
+        self._embeddings = self._resized(self._embeddings, capacity)
+        self._sq_norms = self._resized(self._sq_norms, capacity)
+        self._ids = self._resized(self._ids, capacity)
+        self._has_svd = self._resized(self._has_svd, capacity)
+        if self._reduced is not None:
+            self._reduced = self._resized(self._reduced, capacity)
+            self._reduced_sq_norms = self._resized(self._reduced_sq_norms, capacity)
+        if self._svd_u is not None:
+            self._svd_u = self._resized(self._svd_u, capacity)
+            self._svd_s = self._resized(self._svd_s, capacity)
+            self._svd_v = self._resized(self._svd_v, capacity)
+        if self._exemplars is not None:
+            self._exemplars = self._resized(self._exemplars, capacity)
+            self._exemplar_sq_norms = self._resized(self._exemplar_sq_norms, capacity)
+            self._n_exemplars = self._resized(self._n_exemplars, capacity)
+
+    def _set_svd(self, row, usv_mats):
+        u, s, v = usv_mats['u'], usv_mats['s'], usv_mats['vh'].T
+        if self._svd_u is None:
+            capacity = len(self._embeddings)
+            self._svd_u = np.zeros((capacity,) + u.shape, dtype=np.float32)
+            self._svd_s = np.zeros((capacity,) + s.shape, dtype=np.float32)
+            self._svd_v = np.zeros((capacity,) + v.shape, dtype=np.float32)
+        elif u.shape != self._svd_u.shape[1:] or v.shape != self._svd_v.shape[1:]:
+            raise ValueError(f"SVD with u {u.shape} and vh {v.T.shape} does not match the stored"
+                             f" u {self._svd_u.shape[1:]} and vh {self._svd_v.shape[:0:-1]}.")
+        self._svd_u[row], self._svd_s[row], self._svd_v[row] = u, s, v
 
     def add(self, face_id, face_embedding):
-        self._storage[face_id] = face_embedding
+        # A new row is counted only once filled, so a search running on another
+        # thread never sees it half written. SVD factors only live in the stacked
+        # arrays, see `get_face`.
+        row = self._rows.get(face_id)
+        is_new = row is None
+        if is_new:
+            if self._size == len(self._embeddings):
+                self._grow()
+            row = self._size
+            self._ids[row] = face_id
+        self._set_embedding(row, utils.dlib_embedding(face_embedding))
+        self._has_svd[row] = isinstance(face_embedding, tuple)
+        if self._has_svd[row]:
+            self._set_svd(row, face_embedding[1])
+        if self._exemplars is not None:
+            # A new embedding for the id starts its exemplars over.
+            self._exemplars[row, 0] = self._embeddings[row]
+            # Empty slots are infinitely far, see `find_k_closest_by_dlib_embeddings`.
+            self._exemplar_sq_norms[row] = np.inf
+            self._exemplar_sq_norms[row, 0] = self._sq_norms[row]
+            self._n_exemplars[row] = 1
+        if is_new:
+            self._rows[face_id] = row
+            self._size += 1
+            if str(face_id).isdigit():
+                self._last_face_id = max(self._last_face_id, int(face_id))
+        self._storage[face_id] = utils.dlib_embedding(face_embedding)
+
+    def _set_embedding(self, row, embedding):
+        self._embeddings[row] = embedding
+        self._sq_norms[row] = self._embeddings[row] @ self._embeddings[row]
+        if self._reduced is not None:
+            self._reduced[row] = (self._embeddings[row] - self._pca_mean) @ self._pca_basis
+            self._reduced_sq_norms[row] = self._reduced[row] @ self._reduced[row]
+
+    def add_exemplar(self, face_id, face_embedding):
+        """ Add another embedding of a stored face, keeping at most `exemplars` of them.
+
+        A full set drops one member of its closest pair, the one also closer to
+        the rest, so exemplars stay diverse. Nothing happens with one exemplar per face.
+        """
+        if self._exemplars is None:
+            return
+        row = self._rows[face_id]
+        embedding = np.asarray(utils.dlib_embedding(face_embedding), dtype=np.float32)
+        count = self._n_exemplars[row]
+        if count < self.exemplars:
+            slot = count
+            self._n_exemplars[row] += 1
+        else:
+            slot = _most_redundant(np.vstack([self._exemplars[row], embedding]))
+            if slot == count:
+                return
+        self._exemplars[row, slot] = embedding
+        self._exemplar_sq_norms[row, slot] = embedding @ embedding
+        centroid = self._exemplars[row, :self._n_exemplars[row]].mean(axis=0)
+        self._storage[face_id] = centroid
+        self._set_embedding(row, centroid)
+
+    def get_exemplars(self, face_id):
+        """ (n, dim) exemplars of a face, its only embedding without exemplars. """
+        row = self._rows[face_id]
+        if self._exemplars is None:
+            return self._embeddings[row:row + 1].copy()
+        return self._exemplars[row, :self._n_exemplars[row]].copy()
+
+    def remove(self, face_id):
+        del self._storage[face_id]
+        row = self._rows.pop(face_id)
+        last = self._size - 1
+        if row != last:
+            self._embeddings[row] = self._embeddings[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._ids[row] = self._ids[last]
+            self._rows[self._ids[row]] = row
+            self._has_svd[row] = self._has_svd[last]
+            if self._has_svd[row]:
+                self._svd_u[row], self._svd_s[row], self._svd_v[row] = \
+                    self._svd_u[last], self._svd_s[last], self._svd_v[last]
+            if self._reduced is not None:
+                self._reduced[row] = self._reduced[last]
+                self._reduced_sq_norms[row] = self._reduced_sq_norms[last]
+            if self._exemplars is not None:
+                self._exemplars[row] = self._exemplars[last]
+                self._exemplar_sq_norms[row] = self._exemplar_sq_norms[last]
+                self._n_exemplars[row] = self._n_exemplars[last]
+        self._ids[last] = None
+        self._size = last
 
     def get_face(self, face_id):
-        return self._storage[face_id]
+        row = self._rows[face_id]
+        if not self._has_svd[row]:
+            return self._storage[face_id]
+        usv_mats = {'u': self._svd_u[row].copy(), 's': self._svd_s[row].copy(),
+                    'vh': self._svd_v[row].T.copy()}
+        return self._storage[face_id], usv_mats
+
+    def get_dlib_embeddings(self, face_ids):
+        """ Full precision dlib embeddings of `face_ids` stacked into a matrix. """
+        return np.array([self._storage[face_id] for face_id in face_ids], dtype=np.float64)
+
+    def get_dlib_distances(self, face_embedding, face_ids):
+        """ Euclidean distances of a dlib embedding to `face_ids`, to the closest exemplar with exemplars. """
+        face_embedding = np.asarray(face_embedding, dtype=np.float64)
+        if self._exemplars is None:
+            return np.linalg.norm(self.get_dlib_embeddings(face_ids) - face_embedding, axis=1)
+        dists = np.empty(len(face_ids))
+        for i, face_id in enumerate(face_ids):
+            dists[i] = np.linalg.norm(self.get_exemplars(face_id) - face_embedding, axis=1).min()
+        return dists
 
     def get_face_ids(self):
         return list(self._storage.keys())
@@ -22,36 +212,132 @@ class MemoryDB:
     def __contains__(self, face_id):
         return face_id in self._storage
 
-    def find_closest_by_dlib_embedding(self, face_embedding, dist_fun):
+    def __len__(self):
+        return self._size
+
+    def find_k_closest_by_dlib_embeddings(self, face_embeddings, k=1, metric='euclidean'):
+        """ Resolve a batch of query embeddings against the whole storage at once.
+
+        Returns a list of `k` closest face ids per query and a (n_queries, k)
+        array of their distances, both sorted by ascending distance. With
+        exemplars, a face is as far as its closest exemplar.
+        """
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+
+        queries = search.as_queries(face_embeddings)
+        # Read once, rows appended meanwhile by a writer thread are left out.
+        size = self._size
+        if self._exemplars is None:
+            dists = search.distances(queries, self._embeddings[:size], self._sq_norms[:size], metric)
+        else:
+            # All exemplars in one product, then a min over each face's fixed-size segment of slots.
+            exemplars = self._exemplars[:size]
+            sq_norms = self._exemplar_sq_norms[:size].ravel()
+            dists = search.distances(queries, exemplars.reshape(-1, exemplars.shape[2]), sq_norms, metric)
+            if metric != 'euclidean':
+                # Infinite norms only push empty slots away in euclidean distance.
+                dists[:, np.isinf(sq_norms)] = np.inf
+            dists = dists.reshape(len(queries), size, self.exemplars)
+            # A running minimum over slots is several times faster than `min(axis=2)` over so short an axis.
+            closest = dists[:, :, 0].copy()
+            for slot in range(1, self.exemplars):
+                np.minimum(closest, dists[:, :, slot], out=closest)
+            dists = closest
+        rows, dists = search.top_k(dists, k)
+        return [list(ids) for ids in self._ids[rows]], dists
+
+    def find_k_closest_by_dlib_embedding(self, face_embedding, k=1, metric='euclidean'):
+        face_ids, dists = self.find_k_closest_by_dlib_embeddings([face_embedding], k, metric)
+        return face_ids[0], dists[0]
+
+    def find_closest_by_dlib_embedding(self, face_embedding, dist_fun=utils.euc_dist):
         if self.is_empty():
             raise ValueError("Search is impossible. Storage is empty.")
 
+        if dist_fun is utils.euc_dist:
+            face_ids, dists = self.find_k_closest_by_dlib_embedding(face_embedding)
+            return face_ids[0], float(dists[0])
+
         min_dist = float('inf')
         min_dist_face_id = -1
         for face_id in self._storage:
-            dist = dist_fun(face_embedding, self._storage[face_id])
+            dist = dist_fun(face_embedding, utils.dlib_embedding(self._storage[face_id]))
             if dist < min_dist:
                 min_dist = dist
                 min_dist_face_id = face_id
         return min_dist_face_id, min_dist
 
+    def find_k_closest_by_svd_embedding(self, face_image, k=1):
+        """ Faces whose singular values are closest to the projections of `face_image` on
+        their singular vectors, all faces projected in batched products.
+
+        Returns `k` face ids and their distances, sorted by ascending distance.
+        """
+        if self.is_empty():
+            raise ValueError("Search is impossible. Storage is empty.")
+        if self._svd_u is None:
+            raise ValueError("Search is impossible. No SVD embeddings are stored.")
+
+        matrix = np.asarray(face_image, dtype=np.float32)
+        size = self._size
+        dists = np.empty(size, dtype=np.float32)
+        for start in range(0, size, _SVD_BLOCK):
+            end = min(start + _SVD_BLOCK, size)
+            # Diagonal of u.T @ matrix @ v for every face of the block: (n, h, r) -> (n, r).
+            projections = np.einsum('nhr,nhr->nr', self._svd_u[start:end], matrix @ self._svd_v[start:end])
+            dists[start:end] = np.linalg.norm(projections - self._svd_s[start:end], axis=1)
+        dists[~self._has_svd[:size]] = np.inf
+        rows, dists = search.top_k(dists[None], k)
+        return list(self._ids[rows[0]]), dists[0]
+
     def find_closest_by_svd_embedding(self, face_image):
+        face_ids, _ = self.find_k_closest_by_svd_embedding(face_image)
+        return face_ids[0], self._storage[face_ids[0]]
+
+    def _fit_pca(self, dim):
+        embeddings = self._embeddings[:self._size].astype(np.float64)
+        mean = embeddings.mean(axis=0)
+        # Principal axes from the d x d covariance, cheaper than an SVD of the data when n >> d.
+        eigvals, eigvecs = np.linalg.eigh(np.cov(embeddings - mean, rowvar=False))
+        self._pca_mean = mean.astype(np.float32)
+        self._pca_basis = np.ascontiguousarray(eigvecs[:, ::-1][:, :dim], dtype=np.float32)
+        self._reduced = np.zeros((len(self._embeddings), dim), dtype=np.float32)
+        self._reduced[:self._size] = (self._embeddings[:self._size] - self._pca_mean) @ self._pca_basis
+        self._reduced_sq_norms = search.squared_norms(self._reduced)
+        self._pca_size = self._size
+
+    def find_k_closest_by_pca_embedding(self, face_embedding, k=1, dim=32):
+        """ Closest faces by euclidean distance of embeddings reduced to `dim` principal axes.
+
+        The PCA is fit on the first call and refit whenever `dim` changes or the
+        storage doubled since the last fit. Distances are approximate. With no
+        more faces than `dim` there are too few to fit `dim` axes, and the search
+        is exact instead.
+        """
         if self.is_empty():
             raise ValueError("Search is impossible. Storage is empty.")
+        if self._size <= dim:
+            return self.find_k_closest_by_dlib_embedding(face_embedding, k)
+        if self._pca_basis is None or self._pca_basis.shape[1] != dim or \
+                self._size >= _PCA_REFIT_GROWTH * self._pca_size:
+            self._fit_pca(dim)
 
-        min_dist = float('inf')
-        min_dist_face_id = -1
-        min_dlib_embedding = None
-        for face_id in self._storage:
-            dlib_embedding, usv_mats = self._storage[face_id]
-            svd_embedding = utils.orthogonal_projections(
-                face_image, usv_mats['u'], usv_mats['vh'])
-            dist = utils.euc_dist(svd_embedding, usv_mats['s'])
-            if dist < min_dist:
-                min_dist = dist
-                min_dist_face_id = face_id
-                min_dlib_embedding = dlib_embedding
-        return min_dist_face_id, min_dlib_embedding
+        query = (search.as_queries(utils.dlib_embedding(face_embedding)) - self._pca_mean) @ self._pca_basis
+        dists = search.distances(query, self._reduced[:self._size], self._reduced_sq_norms[:self._size])
+        rows, dists = search.top_k(dists, k)
+        return list(self._ids[rows[0]]), dists[0]
 
     def generate_face_id(self):
-        return str(len(self._storage) + 1)
+        # Ids are never reused, even after removals.
+        return str(self._last_face_id + 1)
+
+
+def _most_redundant(embeddings):
+    """ Index of the member of the closest pair of `embeddings` that is also closer to the others. """
+    dists = search.distances(embeddings, embeddings, search.squared_norms(embeddings))
+    np.fill_diagonal(dists, np.inf)
+    i, j = np.unravel_index(np.argmin(dists), dists.shape)
+    # Each one's nearest neighbour besides the other.
+    dists[i, j] = dists[j, i] = np.inf
+    return i if dists[i].min() <= dists[j].min() else j
@@ -0,0 +1,167 @@
+import numpy as np
+from . import search
+from .ivf import kmeans
+
+KINDS = ('pq', 'sq8')
+_LEVELS = 256
+# Coded rows scored per step of `adc_distances`, bounds the gathered temporaries.
+_ADC_BLOCK = 65536
+# Embeddings coded per step of `ProductQuantizer.encode`, its tables take m KB each.
+_ENCODE_BLOCK = 4096
+
+
+class ProductQuantizer:
+    """ Splits embeddings into `m` sub-vectors and codes each by its closest of 256 k-means centroids.
+
+    A 128-d float32 embedding shrinks from 512 to `m` bytes.
+    """
+
+    kind = 'pq'
+
+    def __init__(self, dim=128, m=16, kmeans_iters=10, seed=0):
+        if dim % m:
+            raise ValueError(f"Embedding dim {dim} is not divisible into {m} sub-vectors.")
+        self.dim = dim
+        self.m = m
+        self._kmeans_iters = kmeans_iters
+        self._seed = seed
+        self.centroids = None
+
+    @property
+    def code_size(self):
+        return self.m
+
+    def _split(self, data):
+        return np.asarray(data, dtype=np.float32).reshape(len(data), self.m, self.dim // self.m)
+
+    def fit(self, data):
+        if len(data) < _LEVELS:
+            raise ValueError(f"At least {_LEVELS} embeddings are needed to train the quantizer.")
+        sub = self._split(data)
+        self.centroids = np.stack([
+            kmeans(np.ascontiguousarray(sub[:, j]), _LEVELS, self._kmeans_iters, self._seed + j)
+            for j in range(self.m)])
+        return self
+
+    def tables(self, queries):
+        """ (n_queries, m, 256) squared distances of every query sub-vector to every centroid. """
+        sub = self._split(queries)
+        return np.einsum('qmd,qmd->qm', sub, sub)[:, :, None] \
+            - 2 * np.einsum('qmd,mkd->qmk', sub, self.centroids) \
+            + np.einsum('mkd,mkd->mk', self.centroids, self.centroids)[None]
+
+    def encode(self, data):
+        data = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        codes = np.empty((len(data), self.m), dtype=np.uint8)
+        for start in range(0, len(data), _ENCODE_BLOCK):
+            codes[start:start + _ENCODE_BLOCK] = np.argmin(
+                self.tables(data[start:start + _ENCODE_BLOCK]), axis=2)
+        return codes
+
+    def decode(self, codes):
+        return self.centroids[np.arange(self.m), codes].reshape(len(codes), self.dim)
+
+    def distances(self, queries, codes):
+        """ (n_queries, n_codes) squared distances, by lookup tables (ADC). """
+        return adc_distances(self.tables(queries), codes)
+
+    def state(self):
+        return {'kind': self.kind, 'dim': self.dim, 'm': self.m, 'centroids': self.centroids}
+
+    def __repr__(self):
+        return f"<ProductQuantizer(dim={self.dim}, m={self.m}, trained={self.centroids is not None})>"
+
+
+class ScalarQuantizer:
+    """ Codes every dimension into 256 uniform levels between its min and max, one byte each. """
+
+    kind = 'sq8'
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.low = self.scale = None
+
+    @property
+    def code_size(self):
+        return self.dim
+
+    @property
+    def centroids(self):
+        """ (dim, 256) value of every level, so ADC works as for a product quantizer. """
+        return self.low[:, None] + self.scale[:, None] * np.arange(_LEVELS, dtype=np.float32)
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=np.float32)
+        self.low = data.min(axis=0)
+        self.scale = np.maximum(data.max(axis=0) - self.low, 1e-12) / (_LEVELS - 1)
+        return self
+
+    def tables(self, queries):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        return np.square(queries[:, :, None] - self.centroids[None])
+
+    def encode(self, data):
+        codes = np.rint((np.asarray(data, dtype=np.float32).reshape(-1, self.dim) - self.low) / self.scale)
+        return np.clip(codes, 0, _LEVELS - 1).astype(np.uint8)
+
+    def decode(self, codes):
+        return self.low + self.scale * codes
+
+    def distances(self, queries, codes):
+        """ (n_queries, n_codes) squared distances to the decoded codes, block by block.
+
+        One matrix product per block beats `adc_distances`, which gathers a table
+        entry for every one of the `dim` bytes of a code.
+        """
+        shifted = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim) - self.low
+        out = np.empty((len(shifted), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _ADC_BLOCK):
+            block = codes[start:start + _ADC_BLOCK] * self.scale
+            out[:, start:start + len(block)] = search.squared_norms(shifted)[:, None] \
+                - 2 * shifted @ block.T + search.squared_norms(block)[None]
+        return out
+
+    def state(self):
+        return {'kind': self.kind, 'dim': self.dim, 'low': self.low, 'scale': self.scale}
+
+    def __repr__(self):
+        return f"<ScalarQuantizer(dim={self.dim}, trained={self.low is not None})>"
+
+
+def adc_distances(tables, codes):
+    """ Asymmetric squared distances of every query to every coded row by summing table entries.
+
+    `tables` comes from the quantizer's `tables`, `codes` from its `encode`.
+    """
+    tables = np.asarray(tables, dtype=np.float32)
+    n_queries, m, _ = tables.shape
+    # Row j of a flattened table starts at j * 256, so codes become flat indices.
+    offsets = np.arange(m, dtype=np.intp) * _LEVELS
+    out = np.empty((n_queries, len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), _ADC_BLOCK):
+        index = codes[start:start + _ADC_BLOCK] + offsets
+        for q in range(n_queries):
+            out[q, start:start + len(index)] = tables[q].ravel()[index].sum(axis=1)
+    return out
+
+
+def get(kind, dim, params=None):
+    if kind == 'pq':
+        return ProductQuantizer(dim, **(params or {}))
+    elif kind == 'sq8':
+        return ScalarQuantizer(dim)
+    else:
+        raise ValueError(f"Quantizer of kind '{kind}' is not supported. Use one of {KINDS}.")
+
+
+def from_state(state):
+    """ Trained quantizer back from `state()`, e.g. as loaded from an `.npz` file. """
+    kind = str(state['kind'])
+    if kind == 'pq':
+        quantizer = ProductQuantizer(int(state['dim']), int(state['m']))
+        quantizer.centroids = np.asarray(state['centroids'], dtype=np.float32)
+    else:
+        quantizer = ScalarQuantizer(int(state['dim']))
+        quantizer.low = np.asarray(state['low'], dtype=np.float32)
+        quantizer.scale = np.asarray(state['scale'], dtype=np.float32)
+    return quantizer
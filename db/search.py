@@ -0,0 +1,43 @@
+import numpy as np
+
+METRICS = ('euclidean', 'cosine')
+
+_EPS = 1e-12
+
+
+def as_queries(face_embeddings):
+    """ Stack one or many embeddings into a 2-D float32 query matrix. """
+    return np.atleast_2d(np.asarray(face_embeddings, dtype=np.float32))
+
+
+def squared_norms(matrix):
+    return np.einsum('ij,ij->i', matrix, matrix)
+
+
+def distances(queries, matrix, sq_norms, metric='euclidean'):
+    """ Distance from every query row to every row of `matrix` in one matrix product.
+
+    `sq_norms` holds the precomputed squared norms of the rows of `matrix`.
+    """
+    dots = queries @ matrix.T
+    if metric == 'euclidean':
+        dists = squared_norms(queries)[:, None] - 2 * dots + sq_norms[None, :]
+        np.maximum(dists, 0, out=dists)
+        return np.sqrt(dists, out=dists)
+    elif metric == 'cosine':
+        norms = np.sqrt(squared_norms(queries))[:, None] * np.sqrt(sq_norms)[None, :]
+        return 1 - dots / np.maximum(norms, _EPS)
+    else:
+        raise ValueError(f"Metric '{metric}' is not supported. Use one of {METRICS}.")
+
+
+def top_k(dists, k):
+    """ Column indices and values of the `k` smallest entries of every row, ascending. """
+    k = min(k, dists.shape[1])
+    if k < dists.shape[1]:
+        idx = np.argpartition(dists, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(k), dists.shape)
+    part = np.take_along_axis(dists, idx, axis=1)
+    order = np.argsort(part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
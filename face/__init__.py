@@ -1,8 +1,12 @@
 from . import detectors, encoders
-from . import trackers
+from . import kalman, trackers
 from . import buffer
 from . import validators
 from . import recognizers
+from . import service
+from . import quality
+from . import progressive
+from . import reid
 
 
 
@@ -1,3 +1,4 @@
+import collections
 import numpy as np
 
 
@@ -5,38 +6,164 @@ class FaceBufferConfig:
     max_len = 25
 
 
-class BufferUpdateException(Exception):
+class _Track:
+    """ Preallocated ring of face crops and their quality scores plus a running float32 sum. """
 
-    def __init__(self):
-        self.message = "Update is not possible. Max size " \
-                       "of mean face buffer is achieved."
-        super().__init__(self.message)
+    def __init__(self, max_len, face_image):
+        self.faces = np.empty((max_len,) + face_image.shape, dtype=np.uint8)
+        self.scores = np.empty(max_len, dtype=np.float32)
+        self.sum = np.zeros(face_image.shape, dtype=np.float32)
+        self.count = 0
+        self.head = 0
+        self.last_seen = 0
+
+    def push(self, face_image, score):
+        if self.count == len(self.faces):
+            self.sum -= self.faces[self.head]
+        else:
+            self.count += 1
+        self.faces[self.head] = face_image
+        self.scores[self.head] = score
+        self.sum += self.faces[self.head]
+        self.head = (self.head + 1) % len(self.faces)
+
+    def ordered(self):
+        """ Buffered crops from the oldest to the newest. """
+        if self.count < len(self.faces):
+            return self.faces[:self.count]
+        return np.roll(self.faces, -self.head, axis=0)
+
+    @property
+    def nbytes(self):
+        return self.faces.nbytes + self.scores.nbytes + self.sum.nbytes
+
+
+class ByteBudget:
+    """ Memory limit shared by the face buffers of several streams.
+
+    Over `max_bytes`, the buffer holding the most bytes gives up its least
+    recently updated track until the total fits again.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._buffers = []
+
+    def register(self, face_buffer):
+        self._buffers.append(face_buffer)
+
+    @property
+    def nbytes(self):
+        return sum(face_buffer.nbytes for face_buffer in self._buffers)
+
+    def fit(self, keep_buffer, keep_face_id):
+        """ Evict tracks until within `max_bytes`, never `keep_face_id` of `keep_buffer`. """
+        while self.nbytes > self.max_bytes:
+            candidates = [(face_buffer, face_buffer.oldest(keep_face_id if face_buffer is keep_buffer else None))
+                          for face_buffer in self._buffers]
+            candidates = [(face_buffer, face_id) for face_buffer, face_id in candidates if face_id is not None]
+            if not candidates:
+                return
+            face_buffer, face_id = max(candidates, key=lambda candidate: candidate[0].nbytes)
+            face_buffer.evict(face_id)
 
 
 class FaceBuffer:
+    """ Last `max_len` face crops of every temporary face id.
 
-    def __init__(self, max_len):
+    Each track keeps a ring of crops and a running sum, so updates and the mean
+    face cost O(1) per frame. Tracks not updated for `ttl` ticks are dropped, and
+    least recently updated tracks are evicted to stay under `max_bytes`. Buffers
+    given one `budget` share its limit instead.
+    """
+
+    def __init__(self, max_len, ttl=None, max_bytes=None, budget=None):
         self._max_len = max_len
-        self._buffer = {}
+        self._ttl = ttl
+        if budget is None and max_bytes is not None:
+            budget = ByteBudget(max_bytes)
+        self._budget = budget
+        if budget is not None:
+            budget.register(self)
+        self._buffer = collections.OrderedDict()
+        self._clock = 0
+        self._nbytes = 0
+        self._evicted = 0
 
-    def update(self, face_id, face_image):
-        if self.is_full(face_id):
-            raise BufferUpdateException()
+    @property
+    def nbytes(self):
+        return self._nbytes
 
-        if face_id not in self._buffer:
-            self._buffer[face_id] = []
-        self._buffer[face_id].append(face_image)
+    def update(self, face_id, face_image, score=0.):
+        track = self._buffer.get(face_id)
+        if track is None:
+            track = self._buffer[face_id] = _Track(self._max_len, face_image)
+            self._nbytes += track.nbytes
+        track.push(face_image, score)
+        track.last_seen = self._clock
+        self._buffer.move_to_end(face_id)
+
+        if self._budget is not None:
+            self._budget.fit(self, face_id)
+
+    def tick(self):
+        """ Advance the buffer clock by one frame and drop stale tracks. """
+        self._clock += 1
+        if self._ttl is None:
+            return
+        # Tracks are ordered by last update, so the stale ones come first.
+        while self._buffer:
+            face_id, track = next(iter(self._buffer.items()))
+            if self._clock - track.last_seen <= self._ttl:
+                break
+            self.evict(face_id)
+
+    def oldest(self, keep_face_id=None):
+        """ Least recently updated face id other than `keep_face_id`, None without one. """
+        for face_id in self._buffer:
+            if face_id != keep_face_id:
+                return face_id
+        return None
+
+    def evict(self, face_id):
+        self.drop_face(face_id)
+        self._evicted += 1
 
     def is_full(self, face_id):
         if face_id not in self._buffer:
             return False
-        return len(self._buffer[face_id]) == self._max_len
+        return self._buffer[face_id].count == self._max_len
 
     def get_mean_face(self, face_id):
-        return np.mean(self._buffer.get(face_id), axis=0).astype(np.uint8)
+        track = self._buffer[face_id]
+        return (track.sum / track.count).astype(np.uint8)
+
+    def get_best_faces(self, face_id, k):
+        """ Up to `k` buffered crops with the highest quality score, best first. """
+        track = self._buffer[face_id]
+        scores = track.scores[:track.count]
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [track.faces[i].copy() for i in best]
+
+    def count(self, face_id):
+        track = self._buffer.get(face_id)
+        return 0 if track is None else track.count
 
     def get_all_faces(self, face_id):
-        return self._buffer[face_id]
+        return self._buffer[face_id].ordered()
 
     def drop_face(self, face_id):
-        del self._buffer[face_id]
+        track = self._buffer.pop(face_id, None)
+        if track is not None:
+            self._nbytes -= track.nbytes
+
+    def __contains__(self, face_id):
+        return face_id in self._buffer
+
+    def stats(self):
+        return {
+            'tracks': len(self._buffer),
+            'bytes': self._nbytes,
+            'max_bytes': None if self._budget is None else self._budget.max_bytes,
+            'evicted': self._evicted,
+        }
@@ -1,18 +1,27 @@
 import abc
+import math
+import multiprocessing
 import cv2
 import dlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from frame.context import gray_of, image_of
 
 
 class AbstractDetector:
 
     @abc.abstractmethod
     def __call__(self, frame):
-        pass
+        """ Face boxes on `frame`, an image or a `frame.context.FrameContext`. """
 
     @abc.abstractmethod
     def __repr__(self):
         pass
 
+    def close(self):
+        """ Release resources held by the detector. """
+
 
 class FakeDetector(AbstractDetector):
 
@@ -36,7 +45,7 @@ class CascadeDetector(AbstractDetector):
         self._min_neighbour = min_neighbour
 
     def __call__(self, frame):
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame = gray_of(frame)
         boxes = self._face_cascade.detectMultiScale(
             frame, self._scale_factor, self._min_neighbour)
         return [tuple(box) for box in boxes]
@@ -57,7 +66,7 @@ class HOGDetector(AbstractDetector):
         self._detector = dlib.get_frontal_face_detector()
 
     def __call__(self, frame):
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame = gray_of(frame)
         faces, scores, idx = self._detector.run(frame, 1, -1)
         return [
             (rect.left(),
@@ -76,6 +85,120 @@ class HOGDetector(AbstractDetector):
         return f"<HOGDetector(threshold={self._threshold})>"
 
 
+_worker_detector = None
+_worker_shm = None
+
+
+def _init_worker(detector):
+    global _worker_detector
+    _worker_detector = get(**detector)
+
+
+def _detect_tile(shm_name, shape, dtype, tile):
+    global _worker_shm
+    if _worker_shm is None or _worker_shm.name != shm_name:
+        if _worker_shm is not None:
+            _worker_shm.close()
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    frame = np.ndarray(shape, dtype, buffer=_worker_shm.buf)
+    x, y, w, h = tile
+    return [(bx + x, by + y, bw, bh)
+            for bx, by, bw, bh in _worker_detector(frame[y:y + h, x:x + w])]
+
+
+def _tiles(width, height, tile_width, tile_height, overlap):
+    """ Overlapping tiles covering the frame, faces up to `overlap` px wide fit in one tile. """
+    def starts(size, tile):
+        if tile >= size:
+            return [0]
+        # Fewest tiles whose neighbours overlap by at least `overlap`, spread evenly.
+        n = max(math.ceil((size - overlap) / max(tile - overlap, 1)), 2)
+        return [round(i * (size - tile) / (n - 1)) for i in range(n)]
+    return [(x, y, min(tile_width, width), min(tile_height, height))
+            for y in starts(height, tile_height) for x in starts(width, tile_width)]
+
+
+def merge_boxes(boxes, threshold=0.5):
+    """ Drop boxes mostly covered by a larger one, e.g. the same face cut at a tile border. """
+    if not boxes:
+        return []
+    arr = np.array(boxes, dtype=np.int64)
+    area = arr[:, 2] * arr[:, 3]
+    order = np.argsort(-area, kind='stable')
+    arr, area = arr[order], area[order]
+    x1, y1 = arr[:, 0], arr[:, 1]
+    x2, y2 = x1 + arr[:, 2], y1 + arr[:, 3]
+    keep = np.ones(len(arr), dtype=bool)
+    for i in range(len(arr)):
+        if not keep[i]:
+            continue
+        iw = np.clip(np.minimum(x2[i], x2[i + 1:]) - np.maximum(x1[i], x1[i + 1:]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[i + 1:]) - np.maximum(y1[i], y1[i + 1:]), 0, None)
+        covered = iw * ih > threshold * np.maximum(area[i + 1:], 1)
+        keep[i + 1:] &= ~covered
+    return [tuple(int(cord) for cord in box) for box in arr[keep]]
+
+
+class ParallelDetector(AbstractDetector):
+    """ Runs another detector over overlapping frame tiles in a process pool.
+
+    The frame is copied once into shared memory that every worker maps, so only
+    tile coordinates and boxes travel between processes. Without `tile_size`
+    every worker gets the whole frame, which only helps when several frames
+    are in flight.
+    """
+
+    def __init__(self, detector, workers=4, tile_size=None, overlap=128, merge_threshold=0.5):
+        self._detector = detector
+        self._workers = workers
+        self._tile_size = tile_size
+        self._overlap = overlap
+        self._merge_threshold = merge_threshold
+        # Forking a process that already runs threads (staged pipeline, enrollment)
+        # can copy a held lock into the worker, so workers start from a clean process.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                         initargs=(detector,))
+        self._shm = None
+
+    def _shared_frame(self, frame):
+        if self._shm is None or self._shm.size < frame.nbytes:
+            self._release_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        np.ndarray(frame.shape, frame.dtype, buffer=self._shm.buf)[...] = frame
+
+    def __call__(self, frame):
+        frame = image_of(frame)
+        self._shared_frame(frame)
+        height, width = frame.shape[:2]
+        tile_width, tile_height = self._tile_size or (width, height)
+        futures = [
+            self._pool.submit(_detect_tile, self._shm.name, frame.shape, frame.dtype, tile)
+            for tile in _tiles(width, height, tile_width, tile_height, self._overlap)
+        ]
+        boxes = [box for future in futures for box in future.result()]
+        return merge_boxes(boxes, self._merge_threshold)
+
+    def _release_shm(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self._pool.shutdown()
+        self._release_shm()
+
+    @property
+    def name(self):
+        return "parallel_detector"
+
+    def __repr__(self):
+        return f"<ParallelDetector(detector={self._detector['name']}, workers={self._workers}," \
+               f" tile_size={self._tile_size}, overlap={self._overlap})>"
+
+
 def get(name, params):
     if name == 'fake_detector':
         return FakeDetector()
@@ -83,5 +206,7 @@ def get(name, params):
         return CascadeDetector(**params)
     elif name == 'hog_detector':
         return HOGDetector(**params)
+    elif name == 'parallel_detector':
+        return ParallelDetector(**params)
     else:
         raise ValueError(f"Face detector with name '{name}' is not found.")
@@ -11,6 +11,10 @@ class AbstractEncoder:
     def __call__(self, face_image):
         """ Encode face image to some vector/matrix representation. """
 
+    def encode_batch(self, face_images):
+        """ Encode a list of face images, returns a list of representations. """
+        return [self(face_image) for face_image in face_images]
+
     @abc.abstractmethod
     def __repr__(self):
         pass
@@ -18,8 +22,11 @@ class AbstractEncoder:
 
 class FakeEncoder(AbstractEncoder):
 
+    def __init__(self, dim=128):
+        self._dim = dim
+
     def __call__(self, face_image):
-        return 0.
+        return np.zeros(self._dim)
 
     def __repr__(self):
         return "<FakeEncoder()>"
@@ -35,25 +42,58 @@ class DlibEncoder(AbstractEncoder):
         shape = self._sp(face_image, dlib.rectangle(0, 0, *face_image.shape[:-1]))
         return np.array(self._face_encoder.compute_face_descriptor(face_image, shape))
 
+    def encode_batch(self, face_images):
+        # The batch overload takes the detections of every image and returns their descriptors per image.
+        shapes = [self._sp(face_image, dlib.rectangle(0, 0, *face_image.shape[:-1]))
+                  for face_image in face_images]
+        shapes = [dlib.full_object_detections([shape]) for shape in shapes]
+        descriptors = self._face_encoder.compute_face_descriptor(face_images, shapes)
+        return [np.array(descriptor[0]) for descriptor in descriptors]
+
     def __repr__(self):
         return "<DlibEncoder()>"
 
 
 class DlibSVDEncoder(DlibEncoder):
+    """ Dlib embedding paired with the SVD of the gray face, truncated to `rank` triplets. """
+
+    def __init__(self, path_to_cnn_model, path_to_landmark_model, rank=None):
+        super().__init__(path_to_cnn_model, path_to_landmark_model)
+        self._rank = rank
 
     def __call__(self, face_image, svd=True):
         out = super().__call__(face_image)
         if svd:
-            out = (out, utils.svd(cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY)))
+            out = (out, utils.svd(cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY), self._rank))
+        return out
+
+    def encode_batch(self, face_images, svd=True):
+        out = super().encode_batch(face_images)
+        if svd:
+            out = [(embedding, utils.svd(cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY), self._rank))
+                   for embedding, face_image in zip(out, face_images)]
         return out
 
     def __repr__(self):
-        return "<DlibSVDEncoder()>"
+        return f"<DlibSVDEncoder(rank={self._rank})>"
+
+
+def fuse(embeddings):
+    """ Fuse embeddings of several crops of one face into one by normalized averaging. """
+    if len(embeddings) == 1:
+        return embeddings[0]
+    if isinstance(embeddings[0], tuple):
+        # (dlib_embedding, usv_mats) pairs keep the SVD of the best crop.
+        return (fuse([embedding[0] for embedding in embeddings]),) + embeddings[0][1:]
+    stacked = np.array(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(stacked, axis=1, keepdims=True)
+    mean = (stacked / np.maximum(norms, 1e-12)).mean(axis=0)
+    return mean / max(np.linalg.norm(mean), 1e-12) * norms.mean()
 
 
 def get(name, params):
     if name == "fake_encoder":
-        return FakeEncoder()
+        return FakeEncoder(**params)
     elif name == "dlib_encoder":
         return DlibEncoder(**params)
     elif name == "dlib_svd_encoder":
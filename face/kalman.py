@@ -0,0 +1,88 @@
+import numpy as np
+
+_DIM = 8
+_MEASUREMENT_DIM = 4
+# Constant velocity over (cx, cy, w, h) with unit time step.
+_F = np.eye(_DIM) + np.eye(_DIM, k=_MEASUREMENT_DIM)
+_H = np.eye(_MEASUREMENT_DIM, _DIM)
+
+
+def _to_state(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.hstack([boxes[:, :2] + boxes[:, 2:] / 2, boxes[:, 2:]])
+
+
+def _to_boxes(states):
+    cxcy, wh = states[:, :2], states[:, 2:4]
+    return np.hstack([cxcy - wh / 2, wh])
+
+
+class KalmanBank:
+    """ Constant-velocity Kalman filters of many box tracks kept in stacked arrays.
+
+    Every track owns one slot. Predictions and corrections run on any subset of
+    slots as single batched matrix operations. Noise scales with box height as in
+    SORT/DeepSORT, so the filter behaves the same for near and far faces.
+    """
+
+    def __init__(self, capacity=64, std_position=1 / 20, std_velocity=1 / 160):
+        self._std_position = std_position
+        self._std_velocity = std_velocity
+        self._x = np.zeros((capacity, _DIM))
+        self._p = np.zeros((capacity, _DIM, _DIM))
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self._x)
+        self._x = np.concatenate([self._x, np.zeros_like(self._x)])
+        self._p = np.concatenate([self._p, np.zeros_like(self._p)])
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _noise(self, heights, std, dims):
+        std = np.asarray(std)[None, :] * heights[:, None]
+        out = np.zeros((len(heights), dims, dims))
+        idx = np.arange(dims)
+        out[:, idx, idx] = np.maximum(std, 1e-2) ** 2
+        return out
+
+    def alloc(self, box):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._x[slot] = 0
+        self._x[slot, :_MEASUREMENT_DIM] = _to_state(box)[0]
+        h = self._x[slot, 3]
+        std = [2 * self._std_position * h] * 4 + [10 * self._std_velocity * h] * 4
+        self._p[slot] = np.diag(np.square(np.maximum(std, 1e-2)))
+        return slot
+
+    def free(self, slot):
+        self._free.append(slot)
+
+    def predict(self, slots):
+        slots = np.asarray(slots, dtype=np.intp)
+        if not len(slots):
+            return
+        heights = self._x[slots, 3]
+        q = self._noise(heights, [self._std_position] * 4 + [self._std_velocity] * 4, _DIM)
+        self._x[slots] = self._x[slots] @ _F.T
+        self._p[slots] = _F @ self._p[slots] @ _F.T + q
+
+    def correct(self, slots, boxes):
+        slots = np.asarray(slots, dtype=np.intp)
+        if not len(slots):
+            return
+        x, p = self._x[slots], self._p[slots]
+        r = self._noise(x[:, 3], [self._std_position] * 4, _MEASUREMENT_DIM)
+        s = _H @ p @ _H.T + r
+        # K = P H^T S^-1, solved as S K^T = H P since S and P are symmetric.
+        k = np.linalg.solve(s, _H @ p).transpose(0, 2, 1)
+        innovation = _to_state(boxes) - x[:, :_MEASUREMENT_DIM]
+        self._x[slots] = x + (k @ innovation[:, :, None])[:, :, 0]
+        self._p[slots] = (np.eye(_DIM) - k @ _H) @ p
+
+    def boxes(self, slots):
+        return _to_boxes(self._x[np.asarray(slots, dtype=np.intp)])
+
+    def __len__(self):
+        return len(self._x) - len(self._free)
@@ -0,0 +1,122 @@
+import numpy as np
+
+METHODS = ('hungarian', 'greedy')
+
+
+def _as_boxes(boxes):
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """ IoU of every box in `boxes_a` with every box in `boxes_b`.
+
+    Same (x, y, w, h) convention and +1 pixel areas as `utils.bb_intersection_over_union`.
+    """
+    a, b = _as_boxes(boxes_a), _as_boxes(boxes_b)
+    ax1, ay1, ax2, ay2 = a[:, 0, None], a[:, 1, None], (a[:, 0] + a[:, 2])[:, None], (a[:, 1] + a[:, 3])[:, None]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter = (np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1) + 1, 0, None) *
+             np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1) + 1, 0, None))
+    area_a = ((a[:, 2] + 1) * (a[:, 3] + 1))[:, None]
+    area_b = (b[:, 2] + 1) * (b[:, 3] + 1)
+    return inter / (area_a + area_b - inter)
+
+
+def linear_assignment(cost):
+    """ Minimum cost assignment of rows to columns (Hungarian method, O(n^2 m)).
+
+    Returns (rows, cols) index arrays, one pair per assigned row or column,
+    whichever are fewer.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    # p[j] is the 1-based row matched to column j, column 0 is a sentinel.
+    p = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while p[j0] != 0:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improve = free & (reduced < minv[1:])
+            minv[1:][improve] = reduced[improve]
+            way[1:][improve] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def greedy_assignment(score):
+    """ Repeatedly take the highest remaining score whose row and column are both free. """
+    score = np.asarray(score)
+    order = np.argsort(-score, axis=None, kind='stable')
+    rows, cols = np.unravel_index(order, score.shape)
+    used_rows = np.zeros(score.shape[0], dtype=bool)
+    used_cols = np.zeros(score.shape[1], dtype=bool)
+    out_rows, out_cols = [], []
+    for row, col in zip(rows, cols):
+        if used_rows[row] or used_cols[col]:
+            continue
+        used_rows[row] = used_cols[col] = True
+        out_rows.append(row)
+        out_cols.append(col)
+        if len(out_rows) == min(score.shape):
+            break
+    return np.array(out_rows, dtype=np.intp), np.array(out_cols, dtype=np.intp)
+
+
+def match(boxes_a, boxes_b, threshold=0.3, method='hungarian'):
+    """ Pairs (i, j) of boxes maximizing total IoU, only pairs with IoU >= `threshold` are kept. """
+    if not len(boxes_a) or not len(boxes_b):
+        return []
+    iou = iou_matrix(boxes_a, boxes_b)
+    if method == 'hungarian':
+        rows, cols = linear_assignment(-iou)
+    elif method == 'greedy':
+        rows, cols = greedy_assignment(iou)
+    else:
+        raise ValueError(f"Matching method '{method}' is not supported. Use one of {METHODS}.")
+    keep = iou[rows, cols] >= threshold
+    return list(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+
+def nms(boxes, max_iou):
+    """ Indices of boxes kept after suppressing the smaller of every pair with IoU > `max_iou`.
+
+    Larger boxes win, ties go to the earlier box. Indices keep the input order.
+    """
+    if not len(boxes):
+        return []
+    arr = _as_boxes(boxes)
+    iou = iou_matrix(arr, arr)
+    suppressed = np.zeros(len(arr), dtype=bool)
+    for i in np.argsort(-arr[:, 2] * arr[:, 3], kind='stable'):
+        if suppressed[i]:
+            continue
+        overlap = iou[i] > max_iou
+        overlap[i] = False
+        suppressed |= overlap
+    return np.flatnonzero(~suppressed).tolist()
@@ -0,0 +1,73 @@
+import collections
+import utils
+from . import encoders
+
+# Face recognizers whose matching is the plain dlib embedding search done here.
+RECOGNIZERS = ('dlib_recognizer',)
+
+
+class _Evidence:
+
+    def __init__(self):
+        self.votes = collections.Counter()
+        self.embeddings = []
+
+
+class ProgressiveRecognizer:
+    """ Resolves tracks frame by frame instead of waiting for a full face buffer.
+
+    Every encoded crop of a track is matched against the storage. An id is
+    accepted at once when the closest face is under `threshold` and beats the
+    runner-up by `margin`, or once it collected `min_votes` frames under
+    `threshold`. The accepted crop's embedding becomes an exemplar of that face
+    when the storage keeps several. A track is enrolled as a new person only
+    after `enroll_after` encoded crops without acceptance, from its
+    `fuse_top_k` best crops.
+
+    Matching searches the storage by dlib embedding directly, so it stands in
+    for one of `RECOGNIZERS` only. `min_quality` needs the face_selection
+    quality scorer, every crop is encoded without it.
+    """
+
+    def __init__(self, threshold=0.6, margin=0.15, min_votes=3, min_quality=0.,
+                 enroll_after=20, fuse_top_k=5):
+        self.min_quality = min_quality
+        self._threshold = threshold
+        self._margin = margin
+        self._min_votes = min_votes
+        self._enroll_after = enroll_after
+        self._fuse_top_k = fuse_top_k
+        self._tracks = {}
+
+    def update(self, track_id, face_embedding, quality, storage):
+        """ Add one encoded crop of a track, returns the resolved face id or None if undecided. """
+        evidence = self._tracks.setdefault(track_id, _Evidence())
+        evidence.embeddings.append((quality, face_embedding))
+
+        if not storage.is_empty():
+            face_ids, dists = storage.find_k_closest_by_dlib_embedding(
+                utils.dlib_embedding(face_embedding), k=2)
+            if dists[0] < self._threshold:
+                evidence.votes[face_ids[0]] += 1
+                runner_up = dists[1] if len(face_ids) > 1 else float('inf')
+                if runner_up - dists[0] >= self._margin or \
+                        evidence.votes[face_ids[0]] >= self._min_votes:
+                    self.drop(track_id)
+                    if storage.exemplars > 1:
+                        storage.add_exemplar(face_ids[0], face_embedding)
+                    return face_ids[0]
+
+        if len(evidence.embeddings) >= self._enroll_after:
+            best = sorted(evidence.embeddings, key=lambda item: -item[0])[:self._fuse_top_k]
+            face_id = storage.generate_face_id()
+            storage.add(face_id, encoders.fuse([embedding for _, embedding in best]))
+            self.drop(track_id)
+            return face_id
+        return None
+
+    def drop(self, track_id):
+        self._tracks.pop(track_id, None)
+
+    def __repr__(self):
+        return f"<ProgressiveRecognizer(threshold={self._threshold}, margin={self._margin}," \
+               f" min_votes={self._min_votes}, enroll_after={self._enroll_after})>"
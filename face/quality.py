@@ -0,0 +1,43 @@
+import dlib
+import numpy as np
+from frame.context import to_gray
+from . import validators
+
+
+class QualityScorer:
+    """ Cheap per-crop quality score in [0, 1] used to pick which crops get encoded.
+
+    Combines sharpness (Laplacian variance, as `LaplaceBlurValidator`), the
+    detected box size and, given a 5-point landmark model, how frontal the face
+    is. Each term saturates at its reference value, sharp faces have a Laplacian
+    variance of a few 1e-3.
+    """
+
+    def __init__(self, sharpness_ref=0.004, size_ref=100, path_to_landmark_model=None):
+        self._sharpness_ref = sharpness_ref
+        self._size_ref = size_ref
+        self._sp = dlib.shape_predictor(path_to_landmark_model) if path_to_landmark_model else None
+
+    def _pose(self, face_image):
+        shape = self._sp(face_image, dlib.rectangle(0, 0, *face_image.shape[1::-1]))
+        points = np.array([(shape.part(i).x, shape.part(i).y) for i in range(5)], dtype=np.float64)
+        # 5-point model: 0-1 right eye corners, 2-3 left eye corners, 4 nose.
+        right_eye, left_eye, nose = points[:2].mean(0), points[2:4].mean(0), points[4]
+        eye_dist = np.linalg.norm(left_eye - right_eye)
+        if eye_dist < 1:
+            return 0.
+        yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_dist
+        roll = abs(left_eye[1] - right_eye[1]) / eye_dist
+        return float(np.clip(1 - 2 * yaw - roll, 0, 1))
+
+    def __call__(self, face_image, face_box):
+        sharpness = validators.laplace_variance(to_gray(face_image))
+        score = min(sharpness / self._sharpness_ref, 1.)
+        score *= min(min(face_box[2], face_box[3]) / self._size_ref, 1.)
+        if self._sp is not None:
+            score *= self._pose(face_image)
+        return score
+
+    def __repr__(self):
+        return f"<QualityScorer(sharpness_ref={self._sharpness_ref}, size_ref={self._size_ref}," \
+               f" pose={self._sp is not None})>"
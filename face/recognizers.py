@@ -8,8 +8,8 @@ import numpy as np
 class AbstractRecognizer:
 
     @abc.abstractmethod
-    def __call__(self, face_image, storage):
-        pass
+    def __call__(self, face_image, storage, face_embedding=None):
+        """ Recognize face on image, `face_embedding` is reused instead of encoding if given. """
 
     @abc.abstractmethod
     def __repr__(self):
@@ -18,7 +18,7 @@ class AbstractRecognizer:
 
 class FakeRecognizer(AbstractRecognizer):
 
-    def __call__(self, face_image, storage):
+    def __call__(self, face_image, storage, face_embedding=None):
         return True, typedef.FAKE_FACE_ID
 
     def __repr__(self):
@@ -32,11 +32,12 @@ class DLibRecognizer(AbstractRecognizer):
         self._encoder = encoder
         self._threshold = threshold
 
-    def __call__(self, face_image, storage):
+    def __call__(self, face_image, storage, face_embedding=None):
         face_id = typedef.UNKNOWN_FACE_ID
         recognized_ok = False
         if not storage.is_empty():
-            face_embedding = self._encoder(face_image)
+            if face_embedding is None:
+                face_embedding = self._encoder(face_image)
             face_id, score = storage.find_closest_by_dlib_embedding(
                 face_embedding, utils.euc_dist)
             recognized_ok = score < self._threshold
@@ -48,13 +49,16 @@ class DLibRecognizer(AbstractRecognizer):
 
 class DlibSVDRecognizer(DLibRecognizer):
 
-    def __call__(self, face_image, storage):
+    def __call__(self, face_image, storage, face_embedding=None):
         face_id = typedef.UNKNOWN_FACE_ID
         recognized_ok = False
         if not storage.is_empty():
             face_id, dlib_embedding = storage.find_closest_by_svd_embedding(
                 cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY))
-            score = utils.euc_dist(self._encoder(face_image, svd=False), dlib_embedding)
+            if face_embedding is None:
+                face_embedding = self._encoder(face_image, svd=False)
+            face_embedding = utils.dlib_embedding(face_embedding)
+            score = utils.euc_dist(face_embedding, dlib_embedding)
             recognized_ok = score < self._threshold
         return recognized_ok, face_id
 
@@ -62,6 +66,55 @@ class DlibSVDRecognizer(DLibRecognizer):
         return f"<DLibSVDRecognizer(encoder={self._encoder}, threshold={self._threshold})>"
 
 
+class CascadeRecognizer(AbstractRecognizer):
+    """ Shortlists `shortlist` candidates with a cheap stage, then re-ranks only them by
+    exact euclidean distance of full dlib embeddings.
+
+    The cheap stage is `prefilter`: 'svd' (singular value projections of the gray
+    face, needs `dlib_svd_encoder`), 'pca' (embeddings reduced to `pca_dim`
+    principal axes) or 'index' (the storage search itself, approximate for the
+    ivf database).
+    """
+
+    PREFILTERS = ('svd', 'pca', 'index')
+
+    def __init__(self, encoder, prefilter='pca', shortlist=32, threshold=0.6, pca_dim=32):
+        if prefilter not in self.PREFILTERS:
+            raise ValueError(f"Prefilter '{prefilter}' is not supported. Use one of {self.PREFILTERS}.")
+        self._encoder = encoder
+        self._prefilter = prefilter
+        self._shortlist = shortlist
+        self._threshold = threshold
+        self._pca_dim = pca_dim
+
+    def _candidates(self, face_image, storage, face_embedding):
+        if self._prefilter == 'svd':
+            gray = face_image if face_image.ndim == 2 else cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY)
+            return storage.find_k_closest_by_svd_embedding(gray, self._shortlist)[0]
+        elif self._prefilter == 'pca':
+            return storage.find_k_closest_by_pca_embedding(face_embedding, self._shortlist, self._pca_dim)[0]
+        return storage.find_k_closest_by_dlib_embedding(face_embedding, self._shortlist)[0]
+
+    def __call__(self, face_image, storage, face_embedding=None):
+        face_id = typedef.UNKNOWN_FACE_ID
+        recognized_ok = False
+        if not storage.is_empty():
+            if face_embedding is None:
+                face_embedding = self._encoder(face_image)
+            face_embedding = utils.dlib_embedding(face_embedding)
+            candidates = self._candidates(face_image, storage, face_embedding)
+            # Distance to the closest exemplar, as the storage search measures it.
+            dists = storage.get_dlib_distances(face_embedding, candidates)
+            best = int(np.argmin(dists))
+            face_id = candidates[best]
+            recognized_ok = dists[best] < self._threshold
+        return recognized_ok, face_id
+
+    def __repr__(self):
+        return f"<CascadeRecognizer(prefilter={self._prefilter}, shortlist={self._shortlist}," \
+               f" threshold={self._threshold})>"
+
+
 def get(encoder, name, params):
     if name == "face_recognizer":
         return FakeRecognizer()
@@ -69,5 +122,7 @@ def get(encoder, name, params):
         return DLibRecognizer(encoder, **params)
     elif name == "dlib_svd_recognizer":
         return DlibSVDRecognizer(encoder, **params)
+    elif name == "cascade_recognizer":
+        return CascadeRecognizer(encoder, **params)
     else:
         raise ValueError(f"Face recognizer with name '{name}' is not found.")
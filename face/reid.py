@@ -0,0 +1,98 @@
+import collections
+import cv2
+import numpy as np
+
+
+def signature(face_image, shape=(8, 8)):
+    """ Cheap appearance signature: a zero-mean, unit-norm float32 thumbnail of the crop, colors included. """
+    thumbnail = cv2.resize(face_image, shape, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    return thumbnail / norm if norm > 0 else thumbnail
+
+
+class _Entry:
+
+    def __init__(self, box, signature):
+        self.box = box
+        self.signature = signature
+        self.lost_at = None
+
+
+class ReidCache:
+    """ Short-term memory of resolved tracks, so a face lost for a few frames gets its id back.
+
+    Resolved tracks are remembered with their box and appearance `signature`.
+    Once their tracker is lost they become candidates for `ttl` ticks: a new
+    detection whose center lies within `max_shift` box widths of a lost box
+    and whose signature correlates at least `min_similarity` with it takes that
+    id back, skipping buffering, encoding and the database search. At most
+    `max_size` ids are kept, the least recently used go first.
+    """
+
+    def __init__(self, ttl=25, max_size=256, max_shift=1., min_similarity=0.8, signature_shape=(8, 8)):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._max_shift = max_shift
+        self._min_similarity = min_similarity
+        self._signature_shape = tuple(signature_shape)
+        self._entries = collections.OrderedDict()
+        self._clock = 0
+        self._hits = 0
+
+    def remember(self, face_id, face_box, face_image):
+        """ Keep a resolved track's box and appearance. """
+        self._entries[face_id] = _Entry(face_box, signature(face_image, self._signature_shape))
+        self._entries.move_to_end(face_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def lose(self, face_id, face_box):
+        """ The tracker of `face_id` was dropped at `face_box`, its id may be matched from now on. """
+        entry = self._entries.get(face_id)
+        if entry is not None:
+            entry.box = face_box
+            entry.lost_at = self._clock
+            self._entries.move_to_end(face_id)
+
+    def match(self, face_box, face_image):
+        """ Id of the lost track `face_box` most likely continues, or None. """
+        x, y, w, h = face_box
+        candidates = [(face_id, entry) for face_id, entry in self._entries.items()
+                      if entry.lost_at is not None and
+                      abs(entry.box[0] + entry.box[2] / 2 - x - w / 2) <= self._max_shift * w and
+                      abs(entry.box[1] + entry.box[3] / 2 - y - h / 2) <= self._max_shift * h]
+        if not candidates:
+            return None
+        similarities = np.stack([entry.signature for _, entry in candidates]) @ \
+            signature(face_image, self._signature_shape)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self._min_similarity:
+            return None
+        face_id, entry = candidates[best]
+        entry.lost_at = None
+        self._entries.move_to_end(face_id)
+        self._hits += 1
+        return face_id
+
+    def tick(self):
+        """ Advance the cache clock by one frame and forget tracks lost for longer than `ttl`. """
+        self._clock += 1
+        expired = [face_id for face_id, entry in self._entries.items()
+                   if entry.lost_at is not None and self._clock - entry.lost_at > self._ttl]
+        for face_id in expired:
+            del self._entries[face_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'ids': len(self._entries),
+            'lost': sum(entry.lost_at is not None for entry in self._entries.values()),
+            'hits': self._hits,
+        }
+
+    def __repr__(self):
+        return f"<ReidCache(ttl={self._ttl}, max_size={self._max_size}, max_shift={self._max_shift}," \
+               f" min_similarity={self._min_similarity})>"
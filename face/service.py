@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EncodingService:
+    """ Gathers face images from any thread and encodes them in batches.
+
+    A batch is sent to `encoder.encode_batch` once `max_batch` images are
+    pending or `max_wait` seconds passed since the first of them arrived.
+    `flush` sends the images submitted so far at once, so a producer that
+    submitted all it has only waits for other producers within `max_wait`.
+    """
+
+    def __init__(self, encoder, max_batch=16, max_wait=0.005):
+        self._encoder = encoder
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._pending = []
+        # Pending images covered by a `flush`, sent without waiting for the batch to fill.
+        self._flushed = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches = 0
+        self.encoded = 0
+        # Started last, the worker uses every attribute above.
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, face_image):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Encoding service is closed.")
+            self._pending.append((face_image, future))
+            self._cond.notify()
+        return future
+
+    def flush(self):
+        """ Encode the images submitted so far without waiting for more. """
+        with self._cond:
+            self._flushed = len(self._pending)
+            self._cond.notify()
+
+    def encode(self, face_images):
+        """ Submit several images and wait for all of their embeddings. """
+        futures = [self.submit(face_image) for face_image in face_images]
+        self.flush()
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed)
+            deadline = time.monotonic() + self._max_wait
+            while len(self._pending) < self._max_batch and not self._flushed and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            batch = self._pending[:self._max_batch]
+            del self._pending[:self._max_batch]
+            self._flushed = max(self._flushed - len(batch), 0)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            face_images, futures = zip(*batch)
+            try:
+                embeddings = self._encoder.encode_batch(list(face_images))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, embedding in zip(futures, embeddings):
+                future.set_result(embedding)
+            self.batches += 1
+            self.encoded += len(batch)
+
+    def close(self):
+        """ Encode whatever is still pending and stop the worker. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def __repr__(self):
+        return f"<EncodingService(encoder={self._encoder}, max_batch={self._max_batch}," \
+               f" max_wait={self._max_wait})>"
@@ -2,6 +2,7 @@ import abc
 import cv2
 import utils
 import typedef
+from . import kalman, matching
 
 
 class AbstractTracker:
@@ -28,16 +29,18 @@ class Tracker:
 
     def __init__(self, tracker_create, trace_len=10):
         self._tracker_create = tracker_create
-        self._tracker = self._tracker_create()
+        self._tracker = self._tracker_create() if tracker_create is not None else None
         self._trace_len = trace_len
 
         self.face_id = -1
+        self.box = None
         self.wasted = False
         self._trace_counter = 0
 
     def init(self, image, face_box, face_id):
         self._tracker.init(image, face_box)
         self.face_id = face_id
+        self.box = face_box
 
     def update(self, image):
         tacked_ok, box = self._tracker.update(image)
@@ -57,38 +60,139 @@ class Tracker:
     def reset_trace_counter(self):
         self._trace_counter = 0
 
+    def miss(self, image):
+        """ Called when no detection matched the tracker on this frame. """
+
+    def release(self):
+        """ Called once the tracker is dropped. """
+
+
+class KalmanTracker(Tracker):
+    """ Track predicted by a constant-velocity Kalman filter in a `KalmanBank`.
+
+    `apply` predicts and corrects all Kalman tracks of a frame sharing a bank in
+    one batch, so their owner passes the same `bank` to all of them; without it
+    the tracker gets a bank of its own. The optional `fallback` appearance
+    tracker only runs while detections are missing.
+    """
+
+    def __init__(self, trace_len=10, fallback=None, bank=None):
+        super().__init__(None, trace_len)
+        self._fallback_create = _appearance_trackers()[fallback] if fallback else None
+        self._fallback = None
+        self._measurement = None
+        self.bank = bank if bank is not None else kalman.KalmanBank(capacity=1)
+        self.slot = None
+
+    def init(self, image, face_box, face_id):
+        self.slot = self.bank.alloc(face_box)
+        self.face_id = face_id
+        self.box = face_box
+
+    def update(self, image):
+        if self._fallback is not None:
+            fallback_ok, box = self._fallback.update(image)
+            if fallback_ok:
+                self.bank.correct([self.slot], [box])
+        x, y, w, h = self.bank.boxes([self.slot])[0]
+        height, width = image.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        box = utils.to_int_cords((x0, y0, min(x + w, width) - x0, min(y + h, height) - y0))
+        return box[2] > 0 and box[3] > 0, box
+
+    def reset(self, image, face_box):
+        self._measurement = face_box
+        self._fallback = None
+        self.reset_trace_counter()
+
+    def miss(self, image):
+        if self._fallback_create is not None and self._fallback is None:
+            self._fallback = self._fallback_create()
+            self._fallback.init(image, self.box)
+
+    def release(self):
+        if self.slot is not None:
+            self.bank.free(self.slot)
+            self.slot = None
 
-def get(name, params):
-    return Tracker(tracker_create={
+
+def _appearance_trackers():
+    return {
         'fake_tracker': FakeTracker,
         'kcf_tracker': cv2.cv2.TrackerKCF_create,
         'mil_tracker': cv2.cv2.TrackerMIL_create,
         'mosse_tracker': cv2.cv2.TrackerMOSSE_create,
-    }[name], **params)
+    }
 
 
-def apply(trackers, image, face_boxes):
-    out_face_ids, out_face_boxes = [], []
+def get(name, params, bank=None):
+    if name == 'kalman_tracker':
+        return KalmanTracker(bank=bank, **params)
+    return Tracker(tracker_create=_appearance_trackers()[name], **params)
+
+
+def _kalman_groups(trackers):
+    groups = {}
+    for tracker in trackers:
+        if isinstance(tracker, KalmanTracker) and tracker.slot is not None:
+            groups.setdefault(tracker.bank, []).append(tracker)
+    return groups
+
+
+def _kalman_predict(trackers):
+    for bank, group in _kalman_groups(trackers).items():
+        bank.predict([tracker.slot for tracker in group])
+
+
+def _kalman_correct(trackers):
+    for bank, group in _kalman_groups(trackers).items():
+        group = [tracker for tracker in group if tracker._measurement is not None]
+        bank.correct([tracker.slot for tracker in group],
+                     [tracker._measurement for tracker in group])
+        for tracker in group:
+            tracker._measurement = None
+
+
+def apply(trackers, image, face_boxes, detected=True, threshold=0.3, method='hungarian'):
+    """ Update trackers and match them to `face_boxes`.
+
+    `detected=False` tells that no detector ran on this frame, so unmatched
+    trackers did not really miss a detection.
+    """
+    _kalman_predict(trackers)
+    tracked = []
     for tracker in trackers:
         track_ok, tracked_face_box = tracker.update(image)
         if track_ok and tracker.is_valid():
-            matched_ok, box_id = utils.match_box(tracked_face_box, face_boxes)
             tracker.update_trace_counter()
-            if matched_ok:
-                tracked_face_box = face_boxes[box_id]
-                tracker.reset(image, tracked_face_box)
-                del face_boxes[box_id]
-            out_face_ids.append(tracker.face_id)
-            out_face_boxes.append(tracked_face_box)
+            tracked.append((tracker, tracked_face_box))
         else:
             tracker.wasted = True
-    for face_box in face_boxes:
-        out_face_ids.append(typedef.UNKNOWN_FACE_ID)
-        out_face_boxes.append(face_box)
+
+    matches = dict(matching.match([box for _, box in tracked], face_boxes, threshold, method))
+    out_face_ids, out_face_boxes = [], []
+    for i, (tracker, tracked_face_box) in enumerate(tracked):
+        if i in matches:
+            tracked_face_box = face_boxes[matches[i]]
+            tracker.reset(image, tracked_face_box)
+        elif detected:
+            tracker.miss(image)
+        tracker.box = tracked_face_box
+        out_face_ids.append(tracker.face_id)
+        out_face_boxes.append(tracked_face_box)
+    matched = set(matches.values())
+    for box_id, face_box in enumerate(face_boxes):
+        if box_id not in matched:
+            out_face_ids.append(typedef.UNKNOWN_FACE_ID)
+            out_face_boxes.append(face_box)
+    _kalman_correct(trackers)
     return out_face_ids, out_face_boxes
 
 
 def drop_wasted(trackers):
+    for tracker in trackers:
+        if tracker.wasted:
+            tracker.release()
     return [tracker for tracker in trackers if not tracker.wasted]
 
 
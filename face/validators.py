@@ -2,15 +2,28 @@ import abc
 import cv2
 import utils
 import numpy as np
+from frame.context import gray_of
+from . import matching
+
+
+def laplace_variance(gray):
+    """ Sharpness of a grayscale image as the variance of its Laplacian. """
+    return cv2.Laplacian(gray, cv2.CV_32F).var() / 255 ** 2
 
 
 class AbstractValidator:
+    # Whether boxes are judged one by one, so a box that passed once on a frame passes again.
+    per_box = True
 
     def _is_valid(self, *args, **kwargs):
         return True
 
+    def select(self, frame, boxes):
+        """ Indices of the valid boxes, `frame` is an image or a `frame.context.FrameContext`. """
+        return [i for i, box in enumerate(boxes) if self._is_valid(box)]
+
     def __call__(self, frame, boxes):
-        return list(filter(self._is_valid, boxes))
+        return [boxes[i] for i in self.select(frame, boxes)]
 
     @abc.abstractmethod
     def __repr__(self):
@@ -19,8 +32,8 @@ class AbstractValidator:
 
 class FakeValidator(AbstractValidator):
 
-    def __call__(self, frame, face_boxes):
-        return face_boxes
+    def select(self, frame, face_boxes):
+        return list(range(len(face_boxes)))
 
     @property
     def name(self):
@@ -52,6 +65,8 @@ class MinBoxSizeValidator(AbstractValidator):
 class SameDetectionValidator(AbstractValidator):
     """ Validate bounding boxes by size. """
 
+    per_box = False
+
     def __init__(self, max_iou=0.6):
         self._max_iou = max_iou
 
@@ -59,58 +74,48 @@ class SameDetectionValidator(AbstractValidator):
     def name(self):
         return "same_detection_validator"
 
-    def __call__(self, frame, boxes):
-        start_i = 0
-        while True:
-            if len(boxes[start_i:]) < 2:
-                break
-            cur_box = boxes[start_i]
-            cur_box_id = start_i
-            start_i += 1
-            box_id_to_delete = -1
-            for box_id, box in enumerate(boxes[start_i:]):
-                iou_score = utils.bb_intersection_over_union(cur_box, box)
-                if iou_score > self._max_iou:
-                    box_id_to_delete = box_id
-                    if utils.box_area(cur_box) < utils.box_area(box):
-                        box_id_to_delete = cur_box_id
-                    break
-            if box_id_to_delete != -1:
-                del boxes[box_id_to_delete]
-                if box_id_to_delete == cur_box_id:
-                    start_i -= 1
-        return boxes
+    def select(self, frame, boxes):
+        return matching.nms(boxes, self._max_iou)
 
     def __repr__(self):
         return f"<SameDetectionsValidator(max_iou={self._max_iou})>"
 
 
 class FFTBlurValidator(AbstractValidator):
+    """ Rejects faces with little high-frequency energy.
+
+    Crops are resized to a common `shape` and scored as one float32 batch. The
+    low band of the spectrum, frequencies under `kernel_size` on both axes, is
+    removed by projecting every crop on it row- and column-wise, two batched
+    matrix products equal to zeroing that band of a real 2-D FFT. A face is
+    blurred when the mean log magnitude of what is left is under `threshold`.
+    """
 
-    def __init__(self, kernel_size, threshold):
+    def __init__(self, kernel_size, threshold, shape=(128, 128)):
         super().__init__()
+        if 2 * kernel_size > min(shape):
+            raise ValueError(f"FFT blur kernel size {kernel_size} does not fit crops of shape {shape}.")
         self._kernel_size = kernel_size
         self._threshold = threshold
-
-    def _is_blurred(self, image):
-        size = self._kernel_size
-        (h, w) = image.shape
-        (cX, cY) = (int(w / 2.0), int(h / 2.0))
-        fft = np.fft.fft2(image)
-        fftShift = np.fft.fftshift(fft)
-        fftShift[cY - size:cY + size, cX - size:cX + size] = 0
-        fftShift = np.fft.ifftshift(fftShift)
-        recon = np.fft.ifft2(fftShift)
-        magnitude = 20 * np.log(np.abs(recon))
-        mean = np.mean(magnitude)
-        return mean <= self._threshold
-
-    def __call__(self, image, boxes):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        return [box for box in boxes if not self._is_blurred(utils.crop(gray, *box))]
+        self._shape = tuple(shape)
+        self._rows = _low_band_projection(self._shape[0], kernel_size)
+        self._cols = _low_band_projection(self._shape[1], kernel_size)
+
+    def scores(self, crops):
+        """ Mean log magnitude of the high frequencies of every crop of an (n, h, w) stack. """
+        crops = crops.astype(np.float32)
+        high = crops - self._rows @ crops @ self._cols
+        return (20 * np.log(np.abs(high) + 1e-6)).mean(axis=(1, 2))
+
+    def select(self, frame, boxes):
+        if not boxes:
+            return []
+        scores = self.scores(stack_crops(gray_of(frame), boxes, self._shape))
+        return np.flatnonzero(scores > self._threshold).tolist()
 
     def __repr__(self):
-        return f"<FFTBlurValidator(kernel_size={self._kernel_size}, threshold={self._threshold})>"
+        return f"<FFTBlurValidator(kernel_size={self._kernel_size}, threshold={self._threshold}," \
+               f" shape={self._shape})>"
 
     @property
     def name(self):
@@ -118,17 +123,21 @@ class FFTBlurValidator(AbstractValidator):
 
 
 class LaplaceBlurValidator(AbstractValidator):
+    """ Rejects faces whose Laplacian variance, as `laplace_variance`, is under `threshold`.
+
+    Crops are scored at their own size, resizing would scale the variance with
+    the face size. Variances of all crops are reduced in one pass.
+    """
 
     def __init__(self, threshold):
         super().__init__()
         self._threshold = threshold
 
-    def _is_blurred(self, image):
-        return cv2.Laplacian(image/255, cv2.CV_64F).var() <= self._threshold
-
-    def __call__(self, image, boxes):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        return [box for box in boxes if not self._is_blurred(utils.crop(gray, *box))]
+    def select(self, frame, boxes):
+        if not boxes:
+            return []
+        scores = laplace_variances(gray_of(frame), boxes)
+        return np.flatnonzero(scores > self._threshold).tolist()
 
     def __repr__(self):
         return f"<LaplaceBlurValidator(threshold={self._threshold})>"
@@ -138,6 +147,34 @@ class LaplaceBlurValidator(AbstractValidator):
         return "blur_validator"
 
 
+def stack_crops(gray, boxes, shape):
+    """ (n, h, w) uint8 stack of the `boxes` crops of `gray`, each resized to `shape` (h, w). """
+    crops = np.empty((len(boxes),) + tuple(shape), dtype=np.uint8)
+    for i, box in enumerate(boxes):
+        # INTER_AREA is several times slower for the fractional factors crops come with.
+        cv2.resize(utils.crop(gray, *box), shape[::-1], dst=crops[i], interpolation=cv2.INTER_LINEAR)
+    return crops
+
+
+def laplace_variances(gray, boxes):
+    """ `laplace_variance` of every `boxes` crop of `gray`, each at its own size. """
+    laplacians = [cv2.Laplacian(utils.crop(gray, *box), cv2.CV_32F).ravel() for box in boxes]
+    sizes = np.array([len(laplacian) for laplacian in laplacians])
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    # Per-crop sums of the concatenated Laplacians, accumulated in float64.
+    flat = np.concatenate(laplacians)
+    means = np.add.reduceat(flat, starts, dtype=np.float64) / sizes
+    squares = np.add.reduceat(np.square(flat, dtype=np.float64), starts) / sizes
+    return (squares - means * means) / 255 ** 2
+
+
+def _low_band_projection(size, kernel_size):
+    """ (size, size) float32 projection of length `size` signals on their frequencies under `kernel_size`. """
+    frequencies = np.fft.fftfreq(size) * size
+    basis = np.fft.fft(np.eye(size), axis=0)[np.abs(frequencies) < kernel_size]
+    return np.real(basis.conj().T @ basis / size).astype(np.float32)
+
+
 def get(name, params=None):
     if name == 'fake_validator':
         return FakeValidator()
@@ -157,7 +194,20 @@ def get_list(name_params_list):
     return [get(**entry) for entry in name_params_list]
 
 
-def apply(validators, image, boxes):
+def apply(validators, frame, boxes, face_ids=None, validated=()):
+    """ Boxes kept by every validator, as (face_ids, boxes) when `face_ids` are given.
+
+    Per-box validators skip the boxes in `validated`, which already passed them on this frame.
+    """
+    keep = list(range(len(boxes)))
     for vld in validators:
-        boxes = vld(image, boxes)
-    return boxes
+        if vld.per_box and validated:
+            passed = [i for i in keep if boxes[i] in validated]
+            checked = [i for i in keep if boxes[i] not in validated]
+            kept = set(passed).union(checked[j] for j in vld.select(frame, [boxes[i] for i in checked]))
+            keep = [i for i in keep if i in kept]
+        else:
+            keep = [keep[j] for j in vld.select(frame, [boxes[i] for i in keep])]
+    if face_ids is None:
+        return [boxes[i] for i in keep]
+    return [face_ids[i] for i in keep], [boxes[i] for i in keep]
@@ -1,2 +1,3 @@
 from . import filters
 from . import drawer
+from . import context
@@ -0,0 +1,65 @@
+import cv2
+from . import filters as _filters
+
+
+class FrameContext:
+    """ One source frame and the images derived from it, each computed lazily and at most once.
+
+    `image` is the frame scaled by `scale` with `filters` applied, it is what
+    detectors, validators, trackers and crops work on. `gray` is its grayscale
+    view. Other per-frame images are shared through `derive`. With scale 1 and
+    no-op filters `image` is the source frame itself, nothing is copied.
+    """
+
+    def __init__(self, original, scale=1., filters=()):
+        self.original = original
+        self.scale = scale
+        self._filters = filters
+        self._cache = {}
+
+    def derive(self, name, fun):
+        """ `fun(self)` computed on first use and cached under `name` for the rest of the frame. """
+        if name not in self._cache:
+            self._cache[name] = fun(self)
+        return self._cache[name]
+
+    @property
+    def scaled(self):
+        return self.derive('scaled', _scale)
+
+    @property
+    def image(self):
+        return self.derive('image', lambda ctx: _filters.apply(ctx._filters, ctx.scaled))
+
+    @property
+    def gray(self):
+        return self.derive('gray', lambda ctx: to_gray(ctx.image))
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def __repr__(self):
+        return f"<FrameContext(shape={self.original.shape}, scale={self.scale})>"
+
+
+def _scale(ctx):
+    if ctx.scale == 1:
+        return ctx.original
+    # INTER_AREA is both the cheapest and the cleanest interpolation for shrinking.
+    interpolation = cv2.INTER_AREA if ctx.scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(ctx.original, None, fx=ctx.scale, fy=ctx.scale, interpolation=interpolation)
+
+
+def to_gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def image_of(frame):
+    """ Image of a `FrameContext` or the array itself, for code taking either. """
+    return frame.image if isinstance(frame, FrameContext) else frame
+
+
+def gray_of(frame):
+    """ Shared grayscale view of a `FrameContext`, or a fresh one of an array. """
+    return frame.gray if isinstance(frame, FrameContext) else to_gray(frame)
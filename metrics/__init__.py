@@ -0,0 +1,16 @@
+from .registry import Registry, NullRegistry
+from . import exporters
+
+
+def get(config=None):
+    """ Metrics registry from the `metrics` config section, a no-op one when disabled. """
+    if not config or not config.get('enabled', True):
+        return NullRegistry()
+    registry = Registry(config.get('sample_rate', 1.), config.get('window', 1000))
+    if config.get('jsonl_path'):
+        registry.add_exporter(exporters.JsonLinesExporter(
+            config['jsonl_path'], config.get('export_interval', 5.)))
+    if config.get('prometheus_port'):
+        registry.add_exporter(exporters.PrometheusExporter(
+            config['prometheus_port'], config.get('prometheus_host', '127.0.0.1')))
+    return registry
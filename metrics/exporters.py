@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JsonLinesExporter:
+    """ Appends a registry snapshot as one JSON line every `interval` seconds. """
+
+    def __init__(self, path, interval=5.):
+        self._path = path
+        self._interval = interval
+        self._last = 0.
+        self._file = None
+
+    def start(self, registry):
+        self._file = open(self._path, 'a')
+        self._last = time.monotonic()
+
+    def poll(self, registry):
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self._write(registry)
+
+    def _write(self, registry):
+        self._file.write(json.dumps(registry.snapshot()) + '\n')
+        self._file.flush()
+
+    def close(self, registry):
+        self._write(registry)
+        self._file.close()
+
+
+def prometheus_text(snapshot, prefix='spyeye'):
+    lines = [f'{prefix}_frames_total {snapshot["frames"]}', f'{prefix}_fps {snapshot["fps"]}']
+    lines += [f'{prefix}_{name}_total {value}' for name, value in snapshot['counters'].items()]
+    lines += [f'{prefix}_{name} {value}' for name, value in snapshot['gauges'].items()]
+    for name, stats in snapshot['timings'].items():
+        metric = f'{prefix}_{name}_seconds'
+        lines.append(f'# TYPE {metric} summary')
+        lines += [f'{metric}{{quantile="0.{key[1:]}"}} {value}'
+                  for key, value in stats.items() if key.startswith('p')]
+        lines.append(f'{metric}_count {stats["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter:
+    """ Serves the registry in Prometheus text format on http://host:port/metrics. """
+
+    def __init__(self, port, host='127.0.0.1'):
+        self._address = (host, port)
+        self._server = None
+
+    def start(self, registry):
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(registry.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(self._address, Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def poll(self, registry):
+        pass
+
+    def close(self, registry):
+        self._server.shutdown()
+        self._server.server_close()
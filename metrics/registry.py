@@ -0,0 +1,145 @@
+import collections
+import random
+import threading
+import time
+import numpy as np
+
+QUANTILES = (50, 95, 99)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('_registry', '_name', '_start')
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry.observe(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class NullRegistry:
+    """ Registry used when metrics are disabled, every call is a no-op. """
+
+    enabled = False
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def observe(self, name, seconds):
+        pass
+
+    def inc(self, name, value=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def tick_frame(self):
+        return False
+
+    def snapshot(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class Registry:
+    """ Per-stage timers, counters and gauges of the processing pipeline.
+
+    Timers keep the last `window` samples of every stage to report p50/p95/p99.
+    Only a `sample_rate` fraction of frames is timed, counters and gauges are
+    always updated. Exporters are polled once per frame.
+    """
+
+    enabled = True
+
+    def __init__(self, sample_rate=1., window=1000):
+        self._sample_rate = sample_rate
+        self._window = window
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = collections.Counter()
+        self._gauges = {}
+        self._exporters = []
+        self._sampled = True
+        self._frames = 0
+        self._frame_times = collections.deque(maxlen=window)
+
+    def add_exporter(self, exporter):
+        self._exporters.append(exporter)
+        exporter.start(self)
+
+    def timer(self, name):
+        if not self._sampled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            samples = self._timings.get(name)
+            if samples is None:
+                samples = self._timings[name] = collections.deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def tick_frame(self):
+        """ Mark the start of a frame, returns whether its stages get timed. """
+        with self._lock:
+            self._frames += 1
+            self._frame_times.append(time.perf_counter())
+        self._sampled = self._sample_rate >= 1 or random.random() < self._sample_rate
+        for exporter in self._exporters:
+            exporter.poll(self)
+        return self._sampled
+
+    def fps(self):
+        if len(self._frame_times) < 2:
+            return 0.
+        return (len(self._frame_times) - 1) / (self._frame_times[-1] - self._frame_times[0])
+
+    def snapshot(self):
+        with self._lock:
+            timings = {name: np.array(samples) for name, samples in self._timings.items() if samples}
+            out = {
+                'time': time.time(),
+                'frames': self._frames,
+                'fps': self.fps(),
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+            }
+        out['timings'] = {
+            name: dict(count=len(samples), mean=float(samples.mean()),
+                       **{f'p{q}': float(v) for q, v in zip(QUANTILES, np.percentile(samples, QUANTILES))})
+            for name, samples in timings.items()
+        }
+        return out
+
+    def close(self):
+        for exporter in self._exporters:
+            exporter.close(self)
@@ -0,0 +1,5 @@
+from . import stream
+from . import processor
+from . import staged
+from . import sources
+from . import writers
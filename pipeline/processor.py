@@ -0,0 +1,207 @@
+import cv2
+import db
+import face
+import frame
+import typedef
+import utils
+import metrics
+from . import scheduler
+
+
+class Processor:
+    """ Models shared by every stream: detector, validators, encoder, recognizer and database.
+
+    Streams only carry their own tracker and buffer state, so memory grows with the
+    number of models rather than with the number of sources, and all streams
+    resolve identities against the same database.
+    """
+
+    def __init__(self, config, storage):
+        enrollment = config.get('enrollment')
+        self._enrollment = db.EnrollmentQueue(storage, **enrollment) if enrollment else None
+        # Enrolled faces go through the write-behind queue, searches see both.
+        self.storage = storage if self._enrollment is None else self._enrollment
+        self._ss = config['source_scale']
+        self._face_shape = tuple(config['face_shape'])
+        self._tracker_config = config['face_tracker']
+        # Kalman tracks of every stream live in one bank owned by the processor.
+        self._kalman_bank = face.kalman.KalmanBank()
+        self._frame_drawer = frame.drawer.Drawer()
+        self._face_detector = face.detectors.get(**config['face_detector'])
+        self._face_validators = face.validators.get_list(config['face_validators'])
+        self._frame_filters = frame.filters.get_list(config['frame_filters'])
+        self._face_encoder = face.encoders.get(**config['face_encoder'])
+        self._face_recognizer = face.recognizers.get(self._face_encoder, **config['face_recognizer'])
+        self._encoding_service = face.service.EncodingService(
+            self._face_encoder, **config.get('encoding_service', {}))
+        self._scheduler = scheduler.DetectionScheduler(**config.get('detection_scheduler', {}))
+        self.metrics = metrics.get(config.get('metrics'))
+        self._tracks_alive = {}
+        selection = config.get('face_selection')
+        self._top_k = selection['top_k'] if selection else None
+        self._min_frames = selection['min_frames'] if selection else None
+        self._quality_scorer = face.quality.QualityScorer(**selection.get('params', {})) \
+            if selection else None
+        progressive = config.get('progressive_recognition')
+        if progressive and config['face_recognizer']['name'] not in face.progressive.RECOGNIZERS:
+            # Progressive recognition matches dlib embeddings itself and would bypass the recognizer.
+            raise ValueError(f"Progressive recognition does not work with face recognizer"
+                             f" '{config['face_recognizer']['name']}'. Use one of"
+                             f" {face.progressive.RECOGNIZERS} or remove progressive_recognition.")
+        if progressive and 'threshold' in progressive:
+            raise ValueError("Progressive recognition uses the face recognizer threshold,"
+                             " set face_recognizer.params.threshold instead.")
+        # Votes are cast with the same match threshold as the frame-by-frame recognizer.
+        threshold = config['face_recognizer'].get('params', {}).get('threshold', 0.6)
+        self._progressive = face.progressive.ProgressiveRecognizer(threshold=threshold, **progressive) \
+            if progressive else None
+
+    def close(self):
+        self._encoding_service.close()
+        self._face_detector.close()
+        if self._enrollment is not None:
+            self._enrollment.close()
+        self.metrics.close()
+
+    def _is_ready(self, face_buffer, face_id):
+        if self._quality_scorer is not None:
+            return face_buffer.count(face_id) >= self._min_frames
+        return face_buffer.is_full(face_id)
+
+    def _select_faces(self, face_buffer, face_id):
+        """ Crops to encode for a track: the best scored ones, or else the mean face. """
+        if self._quality_scorer is not None:
+            return face_buffer.get_best_faces(face_id, self._top_k)
+        return [face_buffer.get_mean_face(face_id)]
+
+    def _resolve(self, face_image, face_embedding):
+        """ Recognize a face or enroll it, reusing its single encoding for both.
+
+        A recognized face's encoding becomes one of its exemplars when the storage keeps several.
+        """
+        recognized_ok, face_id = self._face_recognizer(face_image, self.storage, face_embedding)
+        if not recognized_ok:
+            self.metrics.inc('enrollments')
+            face_id = self.storage.generate_face_id()
+            self.storage.add(face_id, face_embedding)
+        elif self.storage.exemplars > 1 and face_id in self.storage:
+            self.storage.add_exemplar(face_id, face_embedding)
+        return face_id
+
+    def process(self, stream, image):
+        """ Detect, track and recognize faces on `image`, return it annotated in place. """
+        face_buffer = stream.face_buffer
+        reid_cache = stream.reid_cache
+        metrics = self.metrics
+        sampled = metrics.tick_frame()
+        context = frame.context.FrameContext(image, self._ss, self._frame_filters)
+
+        with metrics.timer('resize'):
+            context.scaled
+        with metrics.timer('filters'):
+            image = context.image
+        decision = self._scheduler.plan(stream)
+        with metrics.timer('detect'):
+            if decision == 'full':
+                face_boxes = self._face_detector(context)
+            elif decision == 'roi':
+                face_boxes = self._scheduler.detect_in_rois(self._face_detector, image, stream.face_trackers)
+            else:
+                face_boxes = []
+        metrics.inc('faces_detected', len(face_boxes))
+        with metrics.timer('validate'):
+            detections = face.validators.apply(self._face_validators, context, face_boxes)
+
+        with metrics.timer('track'):
+            face_ids, face_boxes = face.trackers.apply(stream.face_trackers, image, detections,
+                                                       detected=decision != 'skip')
+            for tracker in stream.face_trackers:
+                if tracker.wasted:
+                    face_buffer.drop_face(tracker.face_id)
+                    if self._progressive is not None:
+                        self._progressive.drop(tracker.face_id)
+                    if reid_cache is not None and not utils.is_tmp_id(tracker.face_id):
+                        reid_cache.lose(tracker.face_id, tracker.box)
+            stream.face_trackers = face.trackers.drop_wasted(stream.face_trackers)
+            face_buffer.tick()
+            if reid_cache is not None:
+                reid_cache.tick()
+        with metrics.timer('validate'):
+            # Detections already passed the per-box validators, only tracked boxes are new to them.
+            face_ids, face_boxes = face.validators.apply(
+                self._face_validators, context, face_boxes, face_ids, set(map(tuple, detections)))
+
+        faces, ready = [], []
+        for face_id, face_box in zip(face_ids, face_boxes):
+
+            with metrics.timer('crop'):
+                face_image = utils.crop(image, *face_box)
+                face_image = cv2.resize(face_image, self._face_shape,
+                                        interpolation=cv2.INTER_AREA)
+
+            if face_id == typedef.UNKNOWN_FACE_ID:
+                face_id = reid_cache.match(face_box, face_image) if reid_cache is not None else None
+                if face_id is None:
+                    face_id = utils.generate_tmp_face_id()
+                else:
+                    metrics.inc('reidentified')
+                tracker = face.trackers.get(**self._tracker_config, bank=self._kalman_bank)
+                tracker.init(image, face_box, face_id)
+                stream.face_trackers.append(tracker)
+
+            if utils.is_tmp_id(face_id):
+                with metrics.timer('buffer'):
+                    score = 0. if self._quality_scorer is None else self._quality_scorer(face_image, face_box)
+                    face_buffer.update(face_id, face_image, score)
+                if self._progressive is not None:
+                    # Without a quality scorer every crop gets encoded.
+                    if self._quality_scorer is None or score >= self._progressive.min_quality:
+                        future = self._encoding_service.submit(face_image)
+                        ready.append((len(faces), face_image, [future], score))
+                elif self._is_ready(face_buffer, face_id):
+                    face_images = self._select_faces(face_buffer, face_id)
+                    futures = [self._encoding_service.submit(face_image) for face_image in face_images]
+                    ready.append((len(faces), face_images[0], futures, score))
+            faces.append([face_id, face_box])
+
+        self._scheduler.observe(stream, decision)
+
+        # All selected faces of the frame were submitted together and get encoded as one batch,
+        # sent at once unless other streams add to it within `max_wait`.
+        if ready:
+            self._encoding_service.flush()
+        for i, face_image, futures, score in ready:
+            tracked_face_id = faces[i][0]
+            with metrics.timer('encode'):
+                face_embedding = face.encoders.fuse([future.result() for future in futures])
+            metrics.inc('encodings', len(futures))
+            with metrics.timer('recognize'):
+                if self._progressive is not None:
+                    face_id = self._progressive.update(tracked_face_id, face_embedding, score, self.storage)
+                else:
+                    face_id = self._resolve(face_image, face_embedding)
+            if face_id is None:
+                continue
+            metrics.inc('resolved')
+            faces[i][0] = face_id
+            if reid_cache is not None:
+                reid_cache.remember(face_id, faces[i][1], face_image)
+            face.trackers.update_face_ids(stream.face_trackers, [tracked_face_id], [faces[i][0]])
+            face_buffer.drop_face(tracked_face_id)
+
+        with metrics.timer('draw'):
+            stream.faces = []
+            for face_id, face_box in faces:
+                face_box = tuple(int(cord / self._ss) for cord in face_box)
+                stream.faces.append((face_id, face_box))
+                self._frame_drawer.draw_box(context.original, face_box)
+                self._frame_drawer.draw_face_id(context.original, face_box, face_id)
+
+        if sampled:
+            self._tracks_alive[stream] = len(stream.face_trackers)
+            metrics.set('tracks_alive', sum(self._tracks_alive.values()))
+            metrics.set('face_buffer_bytes', face_buffer.stats()['bytes'])
+            metrics.set('db_size', len(self.storage))
+            if self._enrollment is not None:
+                metrics.set('pending_enrollments', self._enrollment.pending)
+        return context.original
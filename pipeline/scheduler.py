@@ -0,0 +1,88 @@
+import face
+import utils
+
+DECISIONS = ('full', 'roi', 'skip')
+
+
+class _StreamState:
+
+    def __init__(self):
+        self.since_full = None
+        self.anchors = {}
+
+
+class DetectionScheduler:
+    """ Decides per frame whether to run the full detector, detect around tracks only or skip.
+
+    Full detection runs every `every_n` frames, when a tracker was lost, or when
+    some track moved by more than `max_motion` box widths since the last full
+    detection. In between, tracks are carried by their trackers alone or, with
+    `roi_only`, re-detected inside their boxes grown by `roi_margin`.
+    """
+
+    def __init__(self, every_n=1, max_motion=0.5, roi_only=False, roi_margin=0.5):
+        self._every_n = every_n
+        self._max_motion = max_motion
+        self._roi_only = roi_only
+        self._roi_margin = roi_margin
+        self._states = {}
+
+    def _state(self, stream):
+        if stream not in self._states:
+            self._states[stream] = _StreamState()
+        return self._states[stream]
+
+    @staticmethod
+    def _motion(anchor, box):
+        (ax, ay, aw, ah), (x, y, w, h) = anchor, box
+        shift = max(abs((x + w / 2) - (ax + aw / 2)), abs((y + h / 2) - (ay + ah / 2)))
+        return shift / max(aw, 1)
+
+    def plan(self, stream):
+        state = self._state(stream)
+        if state.since_full is None or state.since_full + 1 >= self._every_n:
+            return 'full'
+        if any(tracker not in stream.face_trackers for tracker in state.anchors):
+            # A track got lost since the last full detection.
+            return 'full'
+        for tracker in stream.face_trackers:
+            anchor = state.anchors.get(tracker)
+            if anchor is None:
+                return 'full'
+            if self._motion(anchor, tracker.box) > self._max_motion:
+                return 'full'
+        if self._roi_only and stream.face_trackers:
+            return 'roi'
+        return 'skip'
+
+    def observe(self, stream, decision):
+        """ Record the outcome of a frame once trackers were updated and new ones created. """
+        state = self._state(stream)
+        if decision == 'full':
+            state.since_full = 0
+            state.anchors = {tracker: tracker.box for tracker in stream.face_trackers}
+        else:
+            state.since_full += 1
+
+    def rois(self, frame_shape, trackers):
+        height, width = frame_shape[:2]
+        out = []
+        for tracker in trackers:
+            x, y, w, h = tracker.box
+            dx, dy = int(w * self._roi_margin), int(h * self._roi_margin)
+            x0, y0 = max(x - dx, 0), max(y - dy, 0)
+            x1, y1 = min(x + w + dx, width), min(y + h + dy, height)
+            if x1 > x0 and y1 > y0:
+                out.append((x0, y0, x1 - x0, y1 - y0))
+        return out
+
+    def detect_in_rois(self, detector, image, trackers):
+        boxes = []
+        for x, y, w, h in self.rois(image.shape, trackers):
+            boxes.extend((bx + x, by + y, bw, bh)
+                         for bx, by, bw, bh in detector(utils.crop(image, x, y, w, h)))
+        return face.detectors.merge_boxes(boxes)
+
+    def __repr__(self):
+        return f"<DetectionScheduler(every_n={self._every_n}, max_motion={self._max_motion}," \
+               f" roi_only={self._roi_only}, roi_margin={self._roi_margin})>"
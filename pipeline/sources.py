@@ -0,0 +1,99 @@
+import os
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from .staged import FrameQueue, QueueClosed
+
+
+def is_image_sequence(source):
+    """ Whether `source` is a printf-style image pattern such as `frames/%08d.jpg`. """
+    if not isinstance(source, str) or '%' not in source:
+        return False
+    try:
+        source % 0
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class PrefetchingReader:
+    """ Capturer that decodes frames ahead of the consumer into a bounded queue.
+
+    Videos and cameras are read by one background thread. Image sequences are
+    decoded by `decode_workers` threads in parallel (`cv2.imread` releases the
+    GIL) and queued in frame order. Drop-in for `cv2.VideoCapture` in `Stream`.
+    """
+
+    def __init__(self, source, queue_size=32, decode_workers=4, start=None):
+        self.source = source
+        self.fps = None
+        self._queue = FrameQueue(queue_size, drop_policy='block')
+        self._stop = threading.Event()
+        self._decode_workers = decode_workers
+        if is_image_sequence(source):
+            self._pool = ThreadPoolExecutor(decode_workers)
+            self._start = self._first_index(source) if start is None else start
+            target = self._read_sequence
+        else:
+            self._pool = None
+            self._capturer = cv2.VideoCapture(source)
+            self.fps = self._capturer.get(cv2.CAP_PROP_FPS) or None
+            target = self._read_video
+        self._thread = threading.Thread(target=target, name=f"prefetch-{source}", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _first_index(source):
+        # Same as cv2.VideoCapture, sequences may start at 0 or 1.
+        return 0 if os.path.exists(source % 0) else 1
+
+    def _put(self, frame):
+        try:
+            self._queue.put(frame)
+            return True
+        except QueueClosed:
+            return False
+
+    def _read_video(self):
+        try:
+            while not self._stop.is_set():
+                read_ok, frame = self._capturer.read()
+                if not read_ok or not self._put(frame):
+                    break
+        finally:
+            self._capturer.release()
+            self._queue.close()
+
+    def _read_sequence(self):
+        pending = collections.deque()
+        index = self._start
+        try:
+            while not self._stop.is_set():
+                # Keep every decode worker busy plus one frame in hand.
+                while len(pending) <= self._decode_workers:
+                    pending.append(self._pool.submit(cv2.imread, self.source % index))
+                    index += 1
+                frame = pending.popleft().result()
+                if frame is None or not self._put(frame):
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+            self._queue.close()
+
+    def read(self):
+        try:
+            return True, self._queue.get()
+        except QueueClosed:
+            return False, None
+
+    def release(self):
+        self._stop.set()
+        self._queue.close()
+        self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def __repr__(self):
+        return f"<PrefetchingReader(source={self.source!r})>"
@@ -0,0 +1,239 @@
+import collections
+import threading
+import time
+import cv2
+import typedef
+
+DROP_POLICIES = ('block', 'drop_oldest', 'keep_latest')
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class FrameQueue:
+    """ Bounded queue between pipeline stages.
+
+    When full, `block` makes the producer wait, `drop_oldest` discards the
+    oldest queued item and `keep_latest` discards everything but the new item.
+    """
+
+    def __init__(self, maxsize=4, drop_policy='keep_latest'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Drop policy '{drop_policy}' is not supported. Use one of {DROP_POLICIES}.")
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._drop_policy = drop_policy
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._drop_policy == 'block':
+                while len(self._items) >= self._maxsize and not self._closed:
+                    self._cond.wait()
+            elif self._drop_policy == 'keep_latest':
+                self.dropped += len(self._items)
+                self._items.clear()
+            elif len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            if self._closed:
+                raise QueueClosed()
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                raise QueueClosed()
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StreamQueues:
+    """ One `FrameQueue` per stream, read round-robin.
+
+    A stream only ever drops or waits for its own frames, so a fast camera can
+    neither flush nor starve the queued frames of the others.
+    """
+
+    def __init__(self, streams, maxsize=4, drop_policy='keep_latest'):
+        self._queues = [FrameQueue(maxsize, drop_policy) for _ in streams]
+        self._index = {stream: i for i, stream in enumerate(streams)}
+        self._next = 0
+        # Set by every put, so `get` sleeps only while all queues are empty.
+        self._ready = threading.Event()
+
+    def put(self, stream, item):
+        self._queues[self._index[stream]].put(item)
+        self._ready.set()
+
+    def _poll(self):
+        for offset in range(len(self._queues)):
+            i = (self._next + offset) % len(self._queues)
+            item = self._queues[i].get(timeout=0)
+            if item is not None:
+                self._next = i + 1
+                return item
+        return None
+
+    def get(self, timeout=None):
+        self._ready.clear()
+        item = self._poll()
+        if item is None and self._ready.wait(timeout):
+            item = self._poll()
+        return item
+
+    def close(self):
+        for queue in self._queues:
+            queue.close()
+        self._ready.set()
+
+    @property
+    def dropped(self):
+        return sum(queue.dropped for queue in self._queues)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues)
+
+
+class LatencyCounter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.last = 0.
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def __repr__(self):
+        return f"<LatencyCounter(count={self.count}, mean={self.mean * 1e3:.1f}ms," \
+               f" max={self.max * 1e3:.1f}ms)>"
+
+
+class StagedPipeline:
+    """ Capture threads -> one processing thread -> rendering in the calling thread.
+
+    Every stream gets its own capture thread. A single worker runs the processor
+    so tracker and buffer state is only ever touched from one thread, and
+    rendering stays on the calling thread because `cv2.imshow` requires it.
+    Both hand-offs keep a queue per stream, see `StreamQueues`. An exception in
+    any thread stops the pipeline and is raised again by `run`.
+    """
+
+    def __init__(self, processor, streams, queue_size=4, drop_policy='keep_latest',
+                 idle_sleep=0.01):
+        self._processor = processor
+        self._streams = streams
+        self._idle_sleep = idle_sleep
+        self._work_queue = StreamQueues(streams, queue_size, drop_policy)
+        self._render_queue = StreamQueues(streams, queue_size, drop_policy)
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = [threading.Thread(target=self._capture, args=(stream,), daemon=True)
+                         for stream in streams]
+        self._threads.append(threading.Thread(target=self._work, daemon=True))
+        self.latency = {stage: LatencyCounter()
+                        for stage in ('capture', 'process', 'render', 'total')}
+
+    def _capture(self, stream):
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                read_ok, image = stream.read()
+                self.latency['capture'].add(time.perf_counter() - start)
+                if not read_ok:
+                    image = None
+                    time.sleep(self._idle_sleep)
+                self._work_queue.put(stream, (stream, image, start))
+        except QueueClosed:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(self):
+        try:
+            while not self._stop.is_set():
+                item = self._work_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+                stream, image, captured_at = item
+                if image is None:
+                    image = typedef.NO_VIDEO_FRAME
+                else:
+                    start = time.perf_counter()
+                    image = self._processor.process(stream, image)
+                    self.latency['process'].add(time.perf_counter() - start)
+                self._render_queue.put(stream, (stream, image, captured_at))
+        except QueueClosed:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        # The first error wins, the ones it causes in other threads are dropped.
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+        self._work_queue.close()
+        self._render_queue.close()
+
+    def run(self):
+        for thread in self._threads:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                item = self._render_queue.get(timeout=0.1)
+                if item is not None:
+                    stream, image, captured_at = item
+                    start = time.perf_counter()
+                    cv2.imshow(stream.name, image)
+                    self.latency['render'].add(time.perf_counter() - start)
+                    self.latency['total'].add(time.perf_counter() - captured_at)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord("q"):
+                    break
+        except QueueClosed:
+            pass
+        finally:
+            self.stop()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop.set()
+        self._work_queue.close()
+        self._render_queue.close()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+
+    def stats(self):
+        return {
+            'latency': dict(self.latency),
+            'dropped': {'work': self._work_queue.dropped, 'render': self._render_queue.dropped},
+        }
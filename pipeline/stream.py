@@ -0,0 +1,52 @@
+import cv2
+import face
+from .sources import PrefetchingReader
+
+
+class Stream:
+    """ Per-source state: capturer, face trackers, face buffer and the faces of the last frame.
+
+    `capturer` replaces `cv2.VideoCapture(source)` by any object with `read()` and `release()`.
+    `reid_params` enable a `ReidCache` of recently lost tracks.
+    """
+
+    def __init__(self, source, face_buffer_size, name="Frame", face_buffer_params=None, capturer=None,
+                 reid_params=None):
+        self.source = source
+        self.name = name
+        self.capturer = cv2.VideoCapture(source) if capturer is None else capturer
+        self.face_buffer = face.buffer.FaceBuffer(face_buffer_size, **(face_buffer_params or {}))
+        self.face_trackers = []
+        self.reid_cache = face.reid.ReidCache(**reid_params) if reid_params is not None else None
+        # (face_id, box) pairs in source image coordinates, set by the processor.
+        self.faces = []
+
+    def read(self):
+        return self.capturer.read()
+
+    def release(self):
+        self.capturer.release()
+
+    def __repr__(self):
+        return f"<Stream(source={self.source!r}, name={self.name!r})>"
+
+
+def get_sources(config):
+    """ Video sources from `sources` list, falling back to a single `source`. """
+    return config.get('sources') or [config['source']]
+
+
+def get_list(config, reader_params=None):
+    """ Streams of all configured sources, read by a `PrefetchingReader` when `reader_params` are given.
+
+    The face buffers of all streams share one `max_bytes` budget.
+    """
+    sources = get_sources(config)
+    names = ["Frame"] if len(sources) == 1 else [f"Frame {i}: {src}" for i, src in enumerate(sources)]
+    face_buffer_params = dict(config.get('face_buffer') or {})
+    if face_buffer_params.get('max_bytes') is not None:
+        face_buffer_params['budget'] = face.buffer.ByteBudget(face_buffer_params.pop('max_bytes'))
+    return [Stream(source, config['face_buffer_size'], name, face_buffer_params,
+                   None if reader_params is None else PrefetchingReader(source, **reader_params),
+                   config.get('reid_cache'))
+            for source, name in zip(sources, names)]
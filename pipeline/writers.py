@@ -0,0 +1,54 @@
+import os
+import json
+import cv2
+
+
+class JsonLinesWriter:
+    """ One JSON line per processed frame with the boxes and ids of its faces. """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w')
+
+    def write(self, stream, index, faces):
+        record = {
+            'stream': stream.name,
+            'frame': index,
+            'faces': [{'id': face_id, 'box': [int(v) for v in box]} for face_id, box in faces],
+        }
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class VideoWriter:
+    """ Annotated frames of one stream written with `cv2.VideoWriter`, opened on the first frame. """
+
+    def __init__(self, path, fps=25., fourcc='mp4v'):
+        self.path = path
+        self._fps = fps
+        self._fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self._writer = None
+
+    def write(self, image):
+        if self._writer is None:
+            height, width = image.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, self._fourcc, self._fps, (width, height))
+            if not self._writer.isOpened():
+                raise ValueError(f"Can not open video writer for '{self.path}'.")
+        self._writer.write(image)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+
+
+def video_paths(path, n_streams):
+    """ One output path per stream, `{stream}` in `path` is replaced by the stream index. """
+    if '{stream}' in path:
+        return [path.format(stream=i) for i in range(n_streams)]
+    if n_streams == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}_{i}{ext}" for i in range(n_streams)]
@@ -1,101 +1,120 @@
 import db
 import cv2
-import face
-import frame
 import yaml
 import typedef
-import utils
-import numpy as np
-import copy
+import pipeline
 import pickle
+import time
+import os
 
 
-def main(config):
-    ss = config['source_scale']
-    frame_drawer = frame.drawer.Drawer()
-    capturer = cv2.VideoCapture(config['source'])
-    face_detector = face.detectors.get(**config['face_detector'])
-    face_validators = face.validators.get_list(config['face_validators'])
-    frame_filters = frame.filters.get_list(config['frame_filters'])
-    face_buffer = face.buffer.FaceBuffer(config['face_buffer_size'])
-    face_encoder = face.encoders.get(**config['face_encoder'])
-    face_recognizer = face.recognizers.get(face_encoder, **config['face_recognizer'])
+def load_storage(config):
     storage = db.initialize(**config['database'])
-    face_trackers = []
-
-    try:
+    if not storage.persistent:
+        try:
+            with open('storage.pkl', 'rb') as db_file:
+                storage = pickle.load(db_file)
+                print("Database was loaded from file.")
+        except:
+            print("No databese to load.")
+    elif storage.is_empty() and os.path.exists('storage.pkl') and \
+            not config['database'].get('params', {}).get('read_only'):
+        # First open of a persistent database, take over the faces of the pickled one.
         with open('storage.pkl', 'rb') as db_file:
-            storage = pickle.load(db_file)
-            print("Database was loaded from file.")
-            print(f"Number of persons in DB: {len(storage.get_face_ids())}")
-    except:
-        print("No databese to load.")
+            legacy = pickle.load(db_file)
+        for face_id in legacy.get_face_ids():
+            storage.add(face_id, legacy.get_face(face_id))
+        storage.sync()
+        print(f"Imported {len(legacy.get_face_ids())} faces from storage.pkl.")
+    print(f"Number of persons in DB: {len(storage.get_face_ids())}")
+    if config.get('compaction'):
+        mapping = db.compaction.compact(storage, **config['compaction'])
+        print(f"Merged {len(mapping)} duplicate faces, {len(storage)} persons left.")
+    return storage
 
-    while True:
-        read_ok, image = capturer.read()
-        if not read_ok:
-            cv2.imshow("Frame", typedef.NO_VIDEO_FRAME)
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord("q"):
-                capturer.release()
-                break
-            continue
-        image_copy = image.copy()
 
-        image = cv2.resize(image, None, fx=ss, fy=ss, interpolation=cv2.INTER_CUBIC)
-        image = frame.filters.apply(frame_filters, image)
-        face_boxes = face_detector(image)
-        face_boxes = face.validators.apply(face_validators, image, face_boxes)
+def save_storage(storage):
+    if storage.persistent:
+        storage.close()
+    else:
+        with open('storage.pkl', 'wb') as db_file:
+            pickle.dump(storage, db_file)
 
-        face_ids, face_boxes = face.trackers.apply(face_trackers, image, face_boxes)
-        face_trackers = face.trackers.drop_wasted(face_trackers)
-        _face_boxes = copy.deepcopy(face_boxes)
-        face_boxes = face.validators.apply(face_validators, image, face_boxes)
-        _face_ids = []
-        for face_id, _face_box in zip(face_ids, _face_boxes):
-            for face_box in face_boxes:
-                if _face_box == face_box:
-                    _face_ids.append(face_id)
 
-        for face_id, face_box in zip(_face_ids, face_boxes):
+def run_sequential(processor, streams):
+    while True:
+        for stream in streams:
+            read_ok, image = stream.read()
+            if read_ok:
+                image = processor.process(stream, image)
+            else:
+                image = typedef.NO_VIDEO_FRAME
+            cv2.imshow(stream.name, image)
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord("q"):
+            break
+
 
-            face_image = utils.crop(image, *face_box)
-            face_image = cv2.resize(face_image, tuple(config['face_shape']),
-                                    interpolation=cv2.INTER_AREA)
+def run_headless(processor, streams, jsonl_path=None, video_path=None, video_fps=None):
+    """ Process every stream to its end without a window, as fast as frames get decoded. """
+    jsonl_writer = pipeline.writers.JsonLinesWriter(jsonl_path) if jsonl_path else None
+    video_writers = {}
+    if video_path:
+        for stream, path in zip(streams, pipeline.writers.video_paths(video_path, len(streams))):
+            fps = video_fps or getattr(stream.capturer, 'fps', None) or 25.
+            video_writers[stream] = pipeline.writers.VideoWriter(path, fps)
 
-            if face_id == typedef.UNKNOWN_FACE_ID:
-                face_id = utils.generate_tmp_face_id()
-                tracker = face.trackers.get(**config['face_tracker'])
-                tracker.init(image, face_box, face_id)
-                face_trackers.append(tracker)
+    n_frames = dict.fromkeys(streams, 0)
+    active = list(streams)
+    start = time.perf_counter()
+    try:
+        while active:
+            for stream in list(active):
+                read_ok, image = stream.read()
+                if not read_ok:
+                    active.remove(stream)
+                    continue
+                image = processor.process(stream, image)
+                if jsonl_writer is not None:
+                    jsonl_writer.write(stream, n_frames[stream], stream.faces)
+                if stream in video_writers:
+                    video_writers[stream].write(image)
+                n_frames[stream] += 1
+    finally:
+        if jsonl_writer is not None:
+            jsonl_writer.close()
+        for writer in video_writers.values():
+            writer.close()
+    elapsed = time.perf_counter() - start
+    total = sum(n_frames.values())
+    print(f"Processed {total} frames in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.1f} fps).")
 
-            if utils.is_tmp_id(face_id):
-                face_buffer.update(face_id, face_image)
-                if face_buffer.is_full(face_id):
-                    mean_face = face_buffer.get_mean_face(face_id)
-                    recognized_ok, rec_face_id = face_recognizer(mean_face, storage)
 
-                    tracked_face_id = face_id
-                    if not recognized_ok:
-                        encoded_mean_face = face_encoder(mean_face)
-                        face_id = storage.generate_face_id()
-                        storage.add(face_id, encoded_mean_face)
-                    else:
-                        face_id = rec_face_id
-                    face.trackers.update_face_ids(face_trackers, [tracked_face_id], [face_id])
+def main(config):
+    storage = load_storage(config)
+    processor = pipeline.processor.Processor(config, storage)
+    pipeline_config = config.get('pipeline', {'mode': 'sequential'})
+    params = dict(pipeline_config.get('params', {}))
 
-            face_box = tuple(np.int64(np.array(face_box) * (1 / ss)))
-            frame_drawer.draw_box(image_copy, face_box)
-            frame_drawer.draw_face_id(image_copy, face_box, face_id)
+    if pipeline_config['mode'] == 'headless':
+        reader_params = {key: params.pop(key) for key in ('queue_size', 'decode_workers') if key in params}
+        streams = pipeline.stream.get_list(config, reader_params)
+        run_headless(processor, streams, **params)
+    elif pipeline_config['mode'] == 'threaded':
+        streams = pipeline.stream.get_list(config)
+        staged = pipeline.staged.StagedPipeline(processor, streams, **params)
+        staged.run()
+        print(staged.stats())
+    else:
+        streams = pipeline.stream.get_list(config)
+        run_sequential(processor, streams)
 
-        cv2.imshow("Frame", image_copy)
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord("q"):
-            capturer.release()
-            break
-    cv2.destroyAllWindows()
-    with open('storage.pkl', 'wb') as db_file:
-        pickle.dump(storage, db_file)
+    for stream in streams:
+        stream.release()
+    processor.close()
+    if pipeline_config['mode'] != 'headless':
+        cv2.destroyAllWindows()
+    save_storage(storage)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+import numpy as np
+from face.buffer import ByteBudget, FaceBuffer
+
+
+def _face(value=0):
+    return np.full((10, 10, 3), value, dtype=np.uint8)
+
+
+def test_streams_share_one_budget():
+    budget = ByteBudget(0)
+    first, second = FaceBuffer(4, budget=budget), FaceBuffer(4, budget=budget)
+    first.update('1', _face())
+    track_bytes = first.nbytes
+    budget.max_bytes = 3 * track_bytes
+    first.update('2', _face())
+    second.update('1', _face())
+
+    second.update('2', _face())
+
+    # The largest buffer gave up its least recently updated track.
+    assert '1' not in first and '2' in first
+    assert '1' in second and '2' in second
+    assert budget.nbytes == 3 * track_bytes
+
+
+def test_updated_track_is_never_evicted():
+    face_buffer = FaceBuffer(4, max_bytes=1)
+    face_buffer.update('1', _face())
+    face_buffer.update('2', _face())
+
+    assert '2' in face_buffer and '1' not in face_buffer
+    assert face_buffer.stats()['evicted'] == 1
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import db
+from db import compaction
+
+
+def test_groups_do_not_depend_on_block():
+    rng = np.random.default_rng(0)
+    people = rng.normal(size=(300, 128))
+    people /= np.linalg.norm(people, axis=1, keepdims=True)
+    embeddings = np.vstack([people, people[::3] + rng.normal(scale=0.01, size=(100, 128))])
+
+    tiled = compaction.duplicate_groups(embeddings, 0.4, block=64)
+    whole = compaction.duplicate_groups(embeddings, 0.4, block=len(embeddings))
+
+    assert len(tiled) == 100
+    assert [list(group) for group in tiled] == [list(group) for group in whole]
+
+
+def _duplicated(rng, persons=50):
+    people = rng.normal(size=(persons, 128))
+    people /= np.linalg.norm(people, axis=1, keepdims=True)
+    return people, people + rng.normal(scale=0.01, size=people.shape)
+
+
+def test_compaction_shrinks_disk_storage(tmp_path):
+    rng = np.random.default_rng(0)
+    people, copies = _duplicated(rng)
+    storage = db.initialize('disk', {'path': str(tmp_path), 'capacity': 64})
+    for i, embedding in enumerate(np.vstack([people, copies])):
+        storage.add(str(i + 1), embedding)
+
+    mapping = compaction.compact(storage, 0.4)
+
+    assert len(mapping) == 50 and len(storage) == 50
+    assert storage._size == 50
+    assert storage.find_k_closest_by_dlib_embedding(copies[3])[0] == ['4']
+    assert storage.generate_face_id() == '101'
+    storage.close()
+    reopened = db.initialize('disk', {'path': str(tmp_path), 'read_only': True})
+    assert len(reopened) == 50 and reopened._size == 50
+    assert reopened.generate_face_id() == '101'
+    assert sorted(os.listdir(tmp_path)) == ['embeddings-1.f32', 'index.bin']
+
+
+def test_compaction_shrinks_compressed_storage(tmp_path):
+    rng = np.random.default_rng(0)
+    people, copies = _duplicated(rng, persons=200)
+    storage = db.initialize('compressed', {'path': str(tmp_path), 'm': 8, 'min_train_size': 256})
+    for i, embedding in enumerate(np.vstack([people, copies])):
+        storage.add(str(i + 1), embedding)
+    assert storage.is_trained
+
+    compaction.compact(storage, 0.4, merge='keep')
+
+    assert len(storage) == 200 and storage._size == 200
+    face_ids, _ = storage.find_k_closest_by_dlib_embeddings(copies[:20])
+    assert face_ids == [[str(i + 1)] for i in range(20)]
+    storage.close()
+    reopened = db.initialize('compressed', {'path': str(tmp_path), 'read_only': True})
+    assert reopened.find_k_closest_by_dlib_embeddings(copies[:20])[0] == face_ids
@@ -0,0 +1,21 @@
+from face.detectors import _tiles
+
+
+def test_tiles_are_spread_evenly():
+    tiles = _tiles(1920, 1080, 960, 960, 128)
+
+    assert sorted({x for x, _, _, _ in tiles}) == [0, 480, 960]
+    assert sorted({y for _, y, _, _ in tiles}) == [0, 120]
+
+
+def test_tiles_overlap_by_at_least_overlap():
+    for size in range(961, 4000, 37):
+        xs = [x for x, _, _, _ in _tiles(size, 100, 960, 960, 128)]
+        assert xs[0] == 0 and xs[-1] == size - 960
+        assert all(0 < b - a <= 960 - 128 for a, b in zip(xs, xs[1:]))
+        # One tile fewer could not keep the overlap.
+        assert len(xs) == 2 or (size - 960) / (len(xs) - 2) > 960 - 128
+
+
+def test_frame_within_tile_is_one_tile():
+    assert _tiles(640, 480, 960, 960, 128) == [(0, 0, 640, 480)]
@@ -0,0 +1,45 @@
+import numpy as np
+import db
+
+
+def _readded(rng, path):
+    """ Database where '1' was re-added and committed, but its old row never got tombstoned. """
+    embeddings = rng.normal(size=(3, 128))
+    storage = db.initialize('disk', {'path': path})
+    storage.add('1', embeddings[0])
+    storage.add('2', embeddings[1])
+    storage.sync()
+    old_row = storage._rows['1']
+    storage.add('1', embeddings[2])
+    storage.sync()
+    # As after a crash between the commit of the new row and the tombstone of the old one.
+    storage._records['deleted'][old_row] = 0
+    storage._records.flush()
+    return storage, embeddings
+
+
+def test_read_only_open_masks_readded_rows(tmp_path):
+    storage, embeddings = _readded(np.random.default_rng(0), str(tmp_path))
+    storage.close()
+    reopened = db.initialize('disk', {'path': str(tmp_path), 'read_only': True})
+
+    assert len(reopened) == 2
+    face_ids, _ = reopened.find_k_closest_by_dlib_embedding(embeddings[0], k=2)
+    assert sorted(face_ids) == ['1', '2']
+    assert np.allclose(reopened.get_face('1'), embeddings[2])
+
+
+def test_read_only_refresh_masks_readded_rows(tmp_path):
+    rng = np.random.default_rng(1)
+    writer = db.initialize('disk', {'path': str(tmp_path)})
+    writer.add('3', rng.normal(size=128))
+    writer.sync()
+    reader = db.initialize('disk', {'path': str(tmp_path), 'read_only': True})
+    writer.close()
+    storage, embeddings = _readded(rng, str(tmp_path))
+
+    reader.refresh()
+    assert len(reader) == 3
+    face_ids, _ = reader.find_k_closest_by_dlib_embedding(embeddings[0], k=3)
+    assert sorted(face_ids) == ['1', '2', '3']
+    storage.close()
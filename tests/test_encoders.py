@@ -0,0 +1,29 @@
+import dlib
+import numpy as np
+from face import encoders
+
+
+class _FaceRecognitionModel:
+    """ Stands in for `dlib.face_recognition_model_v1`, checking the batch overload's arguments. """
+
+    def compute_face_descriptor(self, face_images, shapes):
+        assert len(shapes) == len(face_images)
+        assert all(isinstance(detections, dlib.full_object_detections) and len(detections) == 1
+                   for detections in shapes)
+        return [[np.full(128, i, dtype=np.float64)] for i in range(len(face_images))]
+
+
+def _shape_predictor(face_image, rect):
+    return dlib.full_object_detection(rect, [dlib.point(0, 0)] * 5)
+
+
+def test_dlib_encode_batch_returns_one_128d_descriptor_per_image():
+    encoder = encoders.DlibEncoder.__new__(encoders.DlibEncoder)
+    encoder._face_encoder = _FaceRecognitionModel()
+    encoder._sp = _shape_predictor
+    face_images = [np.zeros((60, 60, 3), dtype=np.uint8) for _ in range(3)]
+
+    embeddings = encoder.encode_batch(face_images)
+
+    assert np.array(embeddings).shape == (3, 128)
+    assert [embedding[0] for embedding in embeddings] == [0, 1, 2]
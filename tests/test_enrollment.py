@@ -0,0 +1,55 @@
+import threading
+import numpy as np
+from db.enrollment import EnrollmentQueue
+from db.memory import MemoryDB
+
+
+class SlowSyncDB(MemoryDB):
+    """ Persistent in name, its `sync` blocks until released. """
+
+    persistent = True
+
+    def __init__(self):
+        super().__init__()
+        self.syncing = threading.Event()
+        self.release = threading.Event()
+
+    def sync(self):
+        self.syncing.set()
+        assert self.release.wait(5)
+
+
+def test_search_does_not_wait_for_sync():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(2, 128))
+    storage = SlowSyncDB()
+    storage.add('1', embeddings[0])
+    queue = EnrollmentQueue(storage)
+    queue.add('2', embeddings[1])
+    assert storage.syncing.wait(5)
+
+    found = []
+    search = threading.Thread(target=lambda: found.append(queue.find_k_closest_by_dlib_embeddings(embeddings)))
+    search.start()
+    search.join(1)
+    alive = search.is_alive()
+    storage.release.set()
+    search.join()
+    queue.close()
+
+    assert not alive
+    assert found[0][0] == [['1'], ['2']]
+    assert queue.pending == 0 and queue.written == 1
+
+
+def test_face_enrolled_again_while_written_stays_pending():
+    storage = SlowSyncDB()
+    queue = EnrollmentQueue(storage)
+    queue.add('1', np.zeros(128))
+    assert storage.syncing.wait(5)
+    queue.add('1', np.ones(128))
+    storage.release.set()
+    queue.close()
+
+    np.testing.assert_array_equal(storage.get_face('1'), np.ones(128))
+    assert queue.pending == 0
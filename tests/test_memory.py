@@ -0,0 +1,89 @@
+import pickle
+import numpy as np
+from db.memory import MemoryDB
+
+
+def _baseline_pickle(storage):
+    # MemoryDB of the first release only kept a `_storage` dict.
+    legacy = MemoryDB.__new__(MemoryDB)
+    legacy.__dict__ = {'_storage': storage}
+    return pickle.dumps(legacy)
+
+
+def test_loads_baseline_pickle():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(3, 128))
+    usv_mats = {'u': rng.normal(size=(8, 2)), 's': rng.normal(size=2), 'vh': rng.normal(size=(2, 8))}
+    data = _baseline_pickle({'1': embeddings[0], '2': embeddings[1], '3': (embeddings[2], usv_mats)})
+
+    storage = pickle.loads(data)
+
+    assert len(storage) == 3 and storage.exemplars == 1
+    assert storage.get_face_ids() == ['1', '2', '3']
+    face_ids, dists = storage.find_k_closest_by_dlib_embeddings(embeddings, k=1)
+    assert face_ids == [['1'], ['2'], ['3']]
+    np.testing.assert_allclose(dists[:, 0], 0, atol=1e-3)
+    np.testing.assert_allclose(storage.get_face('3')[1]['vh'], usv_mats['vh'], rtol=1e-5)
+    assert storage.generate_face_id() == '4'
+    storage.add('4', embeddings[0])
+    assert len(storage) == 4
+
+
+def test_loads_pickle_without_exemplars():
+    storage = MemoryDB()
+    storage.add('1', np.ones(128))
+    state = storage.__dict__.copy()
+    for name in ('exemplars', '_exemplars', '_exemplar_sq_norms', '_n_exemplars'):
+        del state[name]
+    legacy = MemoryDB.__new__(MemoryDB)
+    legacy.__dict__ = state
+
+    storage = pickle.loads(pickle.dumps(legacy))
+
+    assert storage.exemplars == 1
+    storage.add_exemplar('1', np.zeros(128))
+    assert storage.find_k_closest_by_dlib_embedding(np.ones(128))[0] == ['1']
+
+
+def test_ivf_pickle_round_trip():
+    from db.ivf import IVFDB
+    storage = IVFDB(n_lists=2, min_train_size=2)
+    storage.add('1', np.ones(128))
+
+    storage = pickle.loads(pickle.dumps(storage))
+
+    assert isinstance(storage, IVFDB)
+    assert storage.find_k_closest_by_dlib_embedding(np.ones(128))[0] == ['1']
+
+
+def test_pca_search_of_tiny_gallery_is_exact():
+    from face.recognizers import CascadeRecognizer
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(2, 128)) * 0.1
+    storage = MemoryDB()
+    storage.add('1', embeddings[0])
+    recognizer = CascadeRecognizer(None, prefilter='pca', pca_dim=32)
+
+    assert recognizer(None, storage, embeddings[0]) == (True, '1')
+    storage.add('2', embeddings[1])
+    assert recognizer(None, storage, embeddings[1]) == (True, '2')
+    face_ids, dists = storage.find_k_closest_by_pca_embedding(embeddings[0], k=2)
+    assert face_ids == ['1', '2'] and dists[0] < 1e-3
+
+
+def test_cascade_reranks_by_closest_exemplar():
+    from face.recognizers import CascadeRecognizer
+    rng = np.random.default_rng(0)
+    near, far = rng.normal(size=(2, 128))
+    near, far = near / np.linalg.norm(near), far / np.linalg.norm(far)
+    storage = MemoryDB(exemplars=4)
+    storage.add('1', near * 0.8)
+    storage.add_exemplar('1', -near * 0.8)
+    storage.add('2', far * 0.8)
+    probe = -near * 0.8 + rng.normal(size=128) * 0.005
+    recognizer = CascadeRecognizer(None, prefilter='index', shortlist=2)
+
+    # The centroid of '1' is 0.8 away from the probe, its second exemplar almost on it.
+    assert np.linalg.norm(storage.get_dlib_embeddings(['1'])[0] - probe) > 0.6
+    assert storage.get_dlib_distances(probe, ['1'])[0] < 0.1
+    assert recognizer(None, storage, probe) == (True, '1')
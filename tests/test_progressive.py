@@ -0,0 +1,29 @@
+import numpy as np
+import db
+from face import progressive
+
+
+def test_accepted_match_becomes_an_exemplar():
+    rng = np.random.default_rng(0)
+    storage = db.initialize('memory', {'exemplars': 4})
+    enrolled, other = rng.normal(size=(2, 128)) * 0.2
+    storage.add('1', enrolled)
+    storage.add('2', other)
+    recognizer = progressive.ProgressiveRecognizer(threshold=0.6, margin=0.15)
+    sighting = enrolled + rng.normal(scale=0.01, size=128)
+
+    assert recognizer.update('tmp:1', sighting, 1., storage) == '1'
+
+    exemplars = storage.get_exemplars('1')
+    assert len(exemplars) == 2
+    np.testing.assert_allclose(exemplars[1], sighting, rtol=1e-5)
+    assert len(storage.get_exemplars('2')) == 1
+
+
+def test_enrollment_does_not_add_exemplars():
+    storage = db.initialize('memory', {'exemplars': 4})
+    recognizer = progressive.ProgressiveRecognizer(enroll_after=1)
+
+    face_id = recognizer.update('tmp:1', np.ones(128), 1., storage)
+
+    assert len(storage.get_exemplars(face_id)) == 1
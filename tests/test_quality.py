@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import yaml
+from face.quality import QualityScorer
+
+
+def _crop(rng):
+    # Texture with about the Laplacian variance of a sharp 60x60 face crop.
+    image = cv2.GaussianBlur(rng.uniform(0, 255, (60, 60)).astype(np.float32), (0, 0), 1.5)
+    gray = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def test_sharp_crop_scores_close_to_one():
+    scorer = QualityScorer(size_ref=60)
+    crop = _crop(np.random.default_rng(0))
+
+    assert scorer(crop, (0, 0, 60, 60)) > 0.95
+
+
+def test_blurred_crop_scores_low():
+    scorer = QualityScorer(size_ref=60)
+    crop = _crop(np.random.default_rng(0))
+
+    assert scorer(cv2.GaussianBlur(crop, (0, 0), 2), (0, 0, 60, 60)) < 0.2
+
+
+def test_config_min_quality_keeps_sharp_and_drops_blurred_crops():
+    with open('config.yml') as f:
+        config = yaml.safe_load(f)
+    params = {k: v for k, v in config['face_selection']['params'].items() if k != 'path_to_landmark_model'}
+    scorer = QualityScorer(**params)
+    min_quality = config['progressive_recognition']['min_quality']
+    crop = _crop(np.random.default_rng(0))
+
+    assert scorer(crop, (0, 0, 60, 60)) >= min_quality
+    assert scorer(cv2.GaussianBlur(crop, (0, 0), 2), (0, 0, 60, 60)) < min_quality
@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from face.service import EncodingService
+
+
+class _Encoder:
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode_batch(self, face_images):
+        self.batch_sizes.append(len(face_images))
+        return [np.full(128, face_image) for face_image in face_images]
+
+
+def test_flush_encodes_without_waiting_for_the_batch():
+    encoder = _Encoder()
+    service = EncodingService(encoder, max_batch=16, max_wait=10.)
+    start = time.monotonic()
+    futures = [service.submit(i) for i in range(3)]
+    service.flush()
+
+    assert [future.result(timeout=1.)[0] for future in futures] == [0, 1, 2]
+    assert time.monotonic() - start < 1.
+    assert encoder.batch_sizes == [3]
+    service.close()
+
+
+def test_unflushed_images_wait_for_other_producers():
+    encoder = _Encoder()
+    service = EncodingService(encoder, max_batch=16, max_wait=0.2)
+    first = service.submit(0)
+    second = service.submit(1)
+    service.flush()
+    first.result(timeout=1.), second.result(timeout=1.)
+    start = time.monotonic()
+    third = service.submit(2)
+    fourth = service.submit(3)
+
+    assert third.result(timeout=1.)[0] == 2 and fourth.result(timeout=1.)[0] == 3
+    assert time.monotonic() - start >= 0.15
+    assert encoder.batch_sizes == [2, 2]
+    service.close()
@@ -0,0 +1,81 @@
+import threading
+import numpy as np
+import pytest
+from pipeline import staged
+from pipeline.staged import StreamQueues
+
+
+def test_keep_latest_drops_only_the_streams_own_frames():
+    queues = StreamQueues(['a', 'b'], maxsize=4, drop_policy='keep_latest')
+    queues.put('a', 'a0')
+    for i in range(3):
+        queues.put('b', f'b{i}')
+
+    assert sorted([queues.get(0), queues.get(0)]) == ['a0', 'b2']
+    assert queues.dropped == 2 and queues.get(0) is None
+
+
+def test_streams_are_read_round_robin():
+    queues = StreamQueues(['a', 'b'], maxsize=4, drop_policy='block')
+    for i in range(3):
+        queues.put('a', f'a{i}')
+    queues.put('b', 'b0')
+
+    assert [queues.get(0) for _ in range(4)] == ['a0', 'b0', 'a1', 'a2']
+
+
+def test_get_wakes_up_on_put():
+    queues = StreamQueues(['a', 'b'])
+    timer = threading.Timer(0.05, queues.put, ('b', 'b0'))
+    timer.start()
+
+    assert queues.get(timeout=5) == 'b0'
+    timer.join()
+
+
+class _Stream:
+    name = 'stream'
+
+    def __init__(self, frames=None):
+        self._frames = frames
+
+    def read(self):
+        if self._frames == 0:
+            raise IOError("camera unplugged")
+        if self._frames is not None:
+            self._frames -= 1
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+
+class _FailingProcessor:
+
+    def process(self, stream, image):
+        raise ValueError("processing failed")
+
+
+def _headless(monkeypatch):
+    monkeypatch.setattr(staged.cv2, 'imshow', lambda name, image: None)
+    monkeypatch.setattr(staged.cv2, 'waitKey', lambda delay: -1)
+
+
+def test_processing_error_is_raised_by_run(monkeypatch):
+    _headless(monkeypatch)
+    pipeline = staged.StagedPipeline(_FailingProcessor(), [_Stream()], drop_policy='block')
+
+    with pytest.raises(ValueError, match="processing failed"):
+        pipeline.run()
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+
+
+def test_capture_error_is_raised_by_run(monkeypatch):
+    _headless(monkeypatch)
+
+    class Processor:
+        def process(self, stream, image):
+            return image
+
+    pipeline = staged.StagedPipeline(Processor(), [_Stream(frames=3)], drop_policy='block')
+
+    with pytest.raises(IOError, match="camera unplugged"):
+        pipeline.run()
+    assert pipeline.latency['render'].count <= 3
@@ -0,0 +1,23 @@
+import numpy as np
+from face import kalman, trackers
+
+
+def test_kalman_trackers_use_the_bank_they_are_given():
+    bank, other = kalman.KalmanBank(), kalman.KalmanBank()
+    image = np.zeros((120, 160, 3), dtype=np.uint8)
+    tracker = trackers.get('kalman_tracker', {}, bank=bank)
+    tracker.init(image, (10, 10, 40, 40), 'a')
+    trackers.get('kalman_tracker', {}, bank=other).init(image, (50, 50, 40, 40), 'b')
+
+    assert tracker.bank is bank and len(bank) == 1 and len(other) == 1
+    face_ids, face_boxes = trackers.apply([tracker], image, [(12, 10, 40, 40)])
+    assert face_ids == ['a'] and tracker.is_valid()
+    tracker.release()
+    assert len(bank) == 0 and len(other) == 1
+
+
+def test_kalman_tracker_without_bank_gets_its_own():
+    first, second = trackers.KalmanTracker(), trackers.KalmanTracker()
+
+    assert first.bank is not second.bank
+    assert first.face_id == -1 and not first.wasted and first.is_valid()
@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+from face import validators
+
+
+def test_laplace_variances_match_laplace_variance_of_each_crop():
+    rng = np.random.default_rng(0)
+    gray = cv2.GaussianBlur(rng.integers(0, 256, (240, 320), dtype=np.uint8), (5, 5), 0)
+    boxes = [(0, 0, 67, 67), (100, 50, 140, 140), (250, 180, 60, 50)]
+
+    expected = [validators.laplace_variance(gray[y:y + h, x:x + w]) for x, y, w, h in boxes]
+
+    np.testing.assert_allclose(validators.laplace_variances(gray, boxes), expected, rtol=1e-5)
+
+
+def test_laplace_blur_validator_rejects_blurred_crops():
+    rng = np.random.default_rng(0)
+    gray = cv2.GaussianBlur(rng.integers(0, 256, (200, 400), dtype=np.uint8), (5, 5), 0)
+    gray[:, 200:] = cv2.GaussianBlur(gray[:, 200:], (9, 9), 3)
+
+    validator = validators.LaplaceBlurValidator(threshold=0.001)
+
+    assert validator.select(gray, [(20, 20, 100, 100), (250, 20, 100, 100)]) == [0]
@@ -3,14 +3,25 @@ import numpy as np
 
 
 def orthogonal_projections(matrix, u, vh):
-    return np.diag(u.T @ matrix @ vh.T)
+    """ Diagonal of `u.T @ matrix @ vh.T` without forming the whole product. """
+    return np.einsum('ij,ij->j', u, matrix @ vh.T)
 
 
-def svd(image):
-    u, s, vh = np.linalg.svd(image, full_matrices=True)
+def svd(image, rank=None):
+    """ Thin SVD of `image` truncated to its `rank` leading singular triplets. """
+    u, s, vh = np.linalg.svd(image, full_matrices=False)
+    if rank is not None:
+        u, s, vh = u[:, :rank], s[:rank], vh[:rank]
     return {'u': u, 's': s, 'vh': vh}
 
 
+def dlib_embedding(face_embedding):
+    """ Dlib embedding of a face, DlibSVDEncoder gives (dlib_embedding, usv_mats) pairs. """
+    if isinstance(face_embedding, tuple):
+        return face_embedding[0]
+    return face_embedding
+
+
 def crop(image, x, y, w, h):
     return image[y:y + h, x:x + w]
 